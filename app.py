@@ -1,12 +1,30 @@
 import os
-from flask import Flask, request, render_template, send_file, jsonify, flash, redirect, url_for
+from flask import Flask, Response, request, render_template, send_file, jsonify, flash, redirect, url_for, session
 from werkzeug.utils import secure_filename
-import UnityPy
+from werkzeug.security import safe_join
 from PIL import Image
 import io
+import json
+import re
+import time
 import shutil
 from pathlib import Path
 import traceback
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from texture_extractor import (TEXTURE_TYPES, THUMBNAIL_EXTENSION, AtlasCache, export_filename, export_parallel,
+                               extract_objects, extract_parallel, filter_textures, list_textures,
+                               open_environment, peek_object_name, read_texture_info, render_object,
+                               render_thumbnail, save_thumbnail, sprite_groups)
+from texture_cache import TextureCache, hash_asset_files, hash_file
+from texture_encoder import TextureEncoder, describe_encode, encode_request
+from texture_replacer import (VERIFY_LEVELS, apply_encoded, clone_file, expected_texture, format_peak_memory,
+                              load_replacement_image, save_environment, stage_in_place_patch, verify_saved_file,
+                              write_patch)
 
 app = Flask(__name__)
 
@@ -26,93 +44,627 @@ configure_app(app)
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB
 app.config['MAX_FILE_SIZE'] = 500  # MB
 
+# 紋理提取的工作行程數量（1 表示在請求執行緒中逐一處理）
+app.config['EXTRACT_WORKERS'] = int(os.environ.get('EXTRACT_WORKERS', os.cpu_count() or 1))
+
+# 延遲提取：上傳時只列出中繼資料，預覽時才解碼
+app.config['LAZY_EXTRACTION'] = os.environ.get('LAZY_EXTRACTION', '1') == '1'
+
+# 已解碼紋理快取的大小上限
+app.config['TEXTURE_CACHE_MAX_BYTES'] = int(os.environ.get('TEXTURE_CACHE_MAX_MB', 2048)) * 1024 * 1024
+
+# 批次替換時平行處理圖片的執行緒數量
+app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', os.cpu_count() or 1))
+
+# 批次替換時平行編碼紋理格式的工作行程數量
+app.config['ENCODE_WORKERS'] = int(os.environ.get('ENCODE_WORKERS', os.cpu_count() or 1))
+
+# 替換紋理時產生 mipmap 的方式：濾波器（box/kaiser）、是否在線性空間濾波、是否以預乘 alpha 濾波
+app.config['MIP_FILTER'] = os.environ.get('MIP_FILTER', 'box')
+app.config['MIP_GAMMA'] = os.environ.get('MIP_GAMMA', '0') == '1'
+app.config['MIP_PREMULTIPLIED'] = os.environ.get('MIP_PREMULTIPLIED', '0') == '1'
+
+# 以記憶體映射載入 .assets/.resS（Windows 上映射中的檔案無法被取代，預設關閉）
+app.config['MMAP_LOADING'] = os.environ.get('MMAP_LOADING', '0' if os.name == 'nt' else '1') == '1'
+
+# 所有工作階段已載入環境的記憶體預算，超過時釋放最久未使用的環境
+app.config['HANDLER_MEMORY_BUDGET'] = int(os.environ.get('HANDLER_MEMORY_BUDGET_MB', 4096)) * 1024 * 1024
+
+# 工作階段閒置超過此時間後釋放其 AssetHandler 並刪除上傳、提取與修改的檔案
+app.config['SESSION_IDLE_TIMEOUT'] = int(os.environ.get('SESSION_IDLE_MINUTES', 120)) * 60
+
+# 延遲儲存：替換紋理時只更新記憶體，下載或呼叫 /commit 時才寫入檔案
+app.config['DEFERRED_COMMIT'] = os.environ.get('DEFERRED_COMMIT', '1') == '1'
+
+# 儲存後的驗證程度：off、header（預設，只重新解析替換的物件）、full（另外解碼比對像素）、reload（讀取所有物件）
+app.config['VERIFY_LEVEL'] = os.environ.get('VERIFY_LEVEL', 'header')
+
+# 可作為替換圖片的副檔名，與 ZIP 批次替換時單一圖片的大小上限
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+ARCHIVE_MAX_IMAGE_BYTES = 256 * 1024 * 1024
+
 # 設定檔案夾路徑
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 OUTPUT_FOLDER = os.path.join(BASE_DIR, 'extracted')
 MODIFIED_FOLDER = os.path.join(BASE_DIR, 'modified')
+CACHE_FOLDER = os.path.join(BASE_DIR, 'cache')
+
+# 跨上傳共用的已解碼紋理快取（不隨首頁清空）
+texture_cache = TextureCache(CACHE_FOLDER, app.config['TEXTURE_CACHE_MAX_BYTES'])
+
+# 替換圖片的編碼器，編碼結果同樣存放在上述快取中
+texture_encoder = TextureEncoder(texture_cache, app.config['ENCODE_WORKERS'],
+                                 mip_filter=app.config['MIP_FILTER'],
+                                 gamma_correct=app.config['MIP_GAMMA'],
+                                 premultiplied=app.config['MIP_PREMULTIPLIED'])
+
+if app.config['VERIFY_LEVEL'] not in VERIFY_LEVELS:
+    raise ValueError(f"VERIFY_LEVEL 必須是 {', '.join(VERIFY_LEVELS)} 之一")
 
 class AssetHandler:
-    def __init__(self):
+    def __init__(self, session_id=''):
+        # 每個工作階段使用各自的資料夾，互不干擾
+        self.session_id = session_id
+        self.upload_folder = os.path.join(UPLOAD_FOLDER, session_id)
+        self.output_folder = os.path.join(OUTPUT_FOLDER, session_id)
+        self.modified_folder = os.path.join(MODIFIED_FOLDER, session_id)
         self.original_file = None
         self.modified_file = None
         self.unity_env = None
+        self.objects_by_id = {}  # path_id -> 物件讀取器
+        self.objects_by_type = {}  # 類型名稱 -> 物件讀取器清單
+        self.texture_objs = []  # 紋理與精靈圖片物件（原始順序）
+        self.listing = []  # 最近一次提取或列出的紋理資訊
+        self.ids_by_name = None  # 紋理名稱 -> path_id 清單，第一次搜尋時建立
+        self.asset_key = None  # 原始檔案的內容雜湊，作為快取鍵值
+        self.rendered = {}  # path_id -> 已解碼的 PNG 路徑
+        self.thumbnails = {}  # path_id -> 縮圖路徑
+        self.revisions = {}  # path_id -> 最近一次替換的識別碼（用於預覽網址的版本）
+        self.atlases = AtlasCache()  # 個別預覽 Sprite 時共用的已解碼圖集
+        self.replaced_ids = set()  # 已替換的 path_id，不再使用原始檔案的快取
+        self.dirty_ids = set()  # 已在記憶體中替換、尚未寫入檔案的 path_id
+        self.pending_images = {}  # path_id -> 待儲存紋理的新圖片（供預覽使用）
+        self.expected = {}  # path_id -> 待儲存紋理應有的狀態（儲存後驗證用）
+        self.lock = threading.RLock()  # UnityPy 的讀取器不可同時使用
+        self.job = None  # 最近一次的背景提取工作
+        self.last_estimate = 0  # 最近一次的記憶體估計（環境使用中時沿用）
+    
+    def reset(self):
+        """
+        重置狀態
+        
+        進行中的背景提取會先被取消；該工作仍持有鎖時不等待，由它結束時自行重置。
+        
+        Returns:
+            bool: 是否已重置
+        """
+        job = self.job
+        if job is not None and job.status == 'running':
+            job.cancel()
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            self.original_file = None
+            self.modified_file = None
+            self.unity_env = None
+            self.objects_by_id = {}
+            self.objects_by_type = {}
+            self.texture_objs = []
+            self.listing = []
+            self.ids_by_name = None
+            self.asset_key = None
+            self.rendered = {}
+            self.thumbnails = {}
+            self.revisions = {}
+            self.replaced_ids = set()
+            self.dirty_ids = set()
+            self.pending_images = {}
+            self.expected = {}
+            return True
+        finally:
+            self.lock.release()
+    
+    def discard(self):
+        """
+        釋放閒置的工作階段：取消背景工作並刪除其上傳、提取與修改的檔案
+        
+        Returns:
+            bool: 是否已釋放（正在處理請求時回傳 False）
+        """
+        if not self.reset():
+            return False
+        with self.lock:
+            for folder in (self.upload_folder, self.output_folder, self.modified_folder):
+                shutil.rmtree(folder, ignore_errors=True)
+        print(f"已釋放閒置的工作階段 {self.session_id}")
+        return True
     
     def set_files(self, original_file):
         """設置檔案路徑"""
+        self.unity_env = None
+        Path(self.modified_folder).mkdir(parents=True, exist_ok=True)
         self.original_file = os.path.abspath(original_file)
-        self.modified_file = os.path.join(MODIFIED_FOLDER, os.path.basename(original_file))
+        self.modified_file = os.path.join(self.modified_folder, os.path.basename(original_file))
         
-        # 複製主要檔案
-        shutil.copy2(self.original_file, self.modified_file)
+        # 以 reflink 或硬連結建立工作副本，第一次修改時才實際複製
+        method = clone_file(self.original_file, self.modified_file)
+        print(f"已建立工作副本（{method}）: {self.modified_file}")
         
-        # 複製 .resS 檔案（如果存在）
+        # .resS 檔案（如果存在）只有在原地修補紋理時才會實際複製
         ress_original = self.original_file + '.resS'
         ress_modified = self.modified_file + '.resS'
         if os.path.exists(ress_original):
-            shutil.copy2(ress_original, ress_modified)
+            method = clone_file(ress_original, ress_modified)
+            print(f"已建立 .resS 工作副本（{method}）: {ress_modified}")
+        elif os.path.lexists(ress_modified):
+            os.remove(ress_modified)
+        
+        self.asset_key = hash_asset_files(self.original_file)
+        self.rendered = {}
+        self.thumbnails = {}
+        self.revisions = {}
+        self.replaced_ids = set()
+        self.dirty_ids = set()
+        self.pending_images = {}
+        self.expected = {}
+        self.unity_env = None
+        self.listing = []
+        self.ids_by_name = None
+    
+    def memory_estimate(self):
+        """
+        估計載入環境後佔用的記憶體（位元組），以檔案大小近似
+        
+        環境正被其他請求使用時不等待，沿用上一次的估計。
+        """
+        if not self.lock.acquire(blocking=False):
+            return self.last_estimate
+        try:
+            if not self.modified_file or not os.path.exists(self.modified_file):
+                self.last_estimate = 0
+                return 0
+            size = os.path.getsize(self.modified_file)
+            # 映射載入的 .resS 由分頁快取管理，不計入
+            ress_file = self.modified_file + '.resS'
+            if os.path.exists(ress_file) and not app.config['MMAP_LOADING']:
+                size += os.path.getsize(ress_file)
+            # 尚未釋放的新圖片（預覽用）也佔用記憶體
+            pending = sum(image.width * image.height * len(image.getbands())
+                          for image in self.pending_images.values())
+            self.last_estimate = size + self.atlases.nbytes() + pending
+            return self.last_estimate
+        finally:
+            self.lock.release()
+    
+    def unload(self):
+        """
+        釋放已載入的環境，之後存取時會自動重新載入
+        
+        待儲存的變更會先寫入修改後的檔案；正在處理請求的環境不會被釋放。
+        """
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            if self.unity_env is None:
+                return True
+            if self.dirty_ids:
+                success, _ = self.commit()
+                if not success:
+                    return False
+            print(f"釋放工作階段 {self.session_id} 的環境")
+            self._drop_environment()
+            # 變更都已寫入檔案，預覽改從檔案解碼
+            self.pending_images.clear()
+            return True
+        finally:
+            self.lock.release()
+    
+    def _drop_environment(self):
+        """捨棄已載入的環境與衍生的索引、圖集，下次存取時從修改後的檔案重新載入"""
+        self.unity_env = None
+        self.objects_by_id = {}
+        self.objects_by_type = {}
+        self.texture_objs = []
+        self.atlases.clear()
     
     def load_environment(self):
-        """載入 Unity 環境"""
-        self.unity_env = UnityPy.load(self.modified_file)
+        """載入 Unity 環境並建立物件索引"""
+        self.unity_env = open_environment(self.modified_file, app.config['MMAP_LOADING'])
+        self.atlases.clear()
+        self._build_index()
+    
+    def _build_index(self):
+        """建立 path_id 與類型索引（名稱不隨替換改變，名稱索引在第一次搜尋時建立並沿用）"""
+        self.objects_by_id = {}
+        self.objects_by_type = {}
+        for obj in self.unity_env.objects:
+            self.objects_by_id[obj.path_id] = obj
+            self.objects_by_type.setdefault(obj.type.name, []).append(obj)
+        self.texture_objs = [obj for obj in self.unity_env.objects if obj.type.name in TEXTURE_TYPES]
+    
+    def get_object(self, path_id):
+        """以 path_id 取得物件讀取器，找不到時回傳 None"""
+        if not self.unity_env:
+            self.load_environment()
+        return self.objects_by_id.get(int(path_id))
     
-    def extract_textures(self):
-        """提取所有紋理"""
+    def texture_objects(self):
+        """依原始順序列出所有紋理與精靈圖片物件"""
         if not self.unity_env:
             self.load_environment()
+        return self.texture_objs
+    
+    def find_by_name(self, name):
+        """以紋理名稱搜尋 path_id"""
+        with self.lock:
+            if self.ids_by_name is None:
+                self.ids_by_name = {}
+                for obj in self.texture_objects():
+                    try:
+                        obj_name = peek_object_name(obj)
+                    except Exception as e:
+                        print(f"讀取 {obj.type.name} (path_id: {obj.path_id}) 名稱時發生錯誤: {e}")
+                        continue
+                    self.ids_by_name.setdefault(obj_name, []).append(obj.path_id)
+            return list(self.ids_by_name.get(name, []))
+    
+    def match_image_name(self, stem):
+        """
+        依圖片檔名（不含副檔名）找出對應的紋理
         
-        extracted = []
-        for obj in self.unity_env.objects:
-            if obj.type.name not in ["Texture2D", "Sprite"]:
-                continue
+        合併三種寫法的結果：紋理名稱、提取時的「名稱_path_id」（前綴必須正是該紋理的名稱）、
+        整個檔名為 path_id。結果超過一個時由呼叫端視為不明確，不自行猜測。
+        
+        Returns:
+            list: 對應到的 path_id（已排序）
+        """
+        with self.lock:
+            candidates = set(self.find_by_name(stem))
+            suffix = re.fullmatch(r'(.+)_(-?\d+)', stem)
+            if suffix and int(suffix.group(2)) in self.find_by_name(suffix.group(1)):
+                candidates.add(int(suffix.group(2)))
+            if re.fullmatch(r'-?\d+', stem):
+                obj = self.get_object(stem)
+                if obj is not None and obj.type.name in TEXTURE_TYPES:
+                    candidates.add(obj.path_id)
+            return sorted(candidates)
+    
+    def _cached(self, path_id):
+        """查詢快取中的紋理，已替換的紋理不使用快取"""
+        if not self.asset_key or path_id in self.replaced_ids:
+            return None
+        return texture_cache.get(self.asset_key, path_id)
+    
+    def _store(self, path_id, png_path, info):
+        """將解碼結果存入快取，回傳之後用來提供預覽的 PNG 路徑"""
+        if not self.asset_key or path_id in self.replaced_ids:
+            return png_path
+        return texture_cache.put(self.asset_key, path_id, png_path, info)
+    
+    def extract_textures(self, workers=None, job=None):
+        """提取所有紋理（workers 大於 1 時使用行程池平行處理，已快取的紋理直接沿用）"""
+        with self.lock:
+            if not self.unity_env:
+                self.load_environment()
+            
+            if workers is None:
+                workers = app.config['EXTRACT_WORKERS']
+            
+            texture_objs = self.texture_objects()
+            if job:
+                job.start_phase(len(texture_objs))
+            
+            extracted = {}
+            pending = []
+            for obj in texture_objs:
+                cached = self._cached(obj.path_id)
+                if cached:
+                    self.rendered[obj.path_id], extracted[obj.path_id] = cached
+                else:
+                    pending.append(obj)
+            if job and extracted:
+                job.advance(len(extracted), list(extracted.values()), None)
+            
+            def finish(count, infos, path_id):
+                """每批解碼完成後存入快取並回報進度"""
+                for info in infos:
+                    png_path = os.path.join(self.output_folder, info['path'])
+                    self.rendered[info['path_id']] = self._store(info['path_id'], png_path, info)
+                    extracted[info['path_id']] = info
+                if job:
+                    job.advance(count, infos, path_id)
+            
+            if workers > 1 and len(pending) > 1:
+                path_ids = [obj.path_id for obj in pending]
+                # 共用圖集的 Sprite 交給同一個工作行程，圖集只解碼一次
+                extract_parallel(self.modified_file, path_ids, self.output_folder, workers,
+                                 app.config['MMAP_LOADING'], progress=finish, groups=sprite_groups(pending))
+            else:
+                for obj, info, error in extract_objects(pending, self.output_folder):
+                    if error:
+                        print(error)
+                    finish(1, [info] if info else [], obj.path_id)
+            
+            self.listing = [extracted[obj.path_id] for obj in texture_objs if obj.path_id in extracted]
+            return self.listing
+    
+    def list_textures(self, job=None):
+        """列出所有紋理的中繼資料（不解碼像素）"""
+        with self.lock:
+            use_cache = self.asset_key and not self.replaced_ids
+            listing = texture_cache.get_listing(self.asset_key) if use_cache else None
+            if listing is None:
+                texture_objs = self.texture_objects()
+                if job:
+                    job.start_phase(len(texture_objs))
+                listing = list_textures(texture_objs, progress=job.advance if job else None)
+                if use_cache:
+                    texture_cache.put_listing(self.asset_key, listing)
+            elif job:
+                job.start_phase(len(listing))
+                job.advance(len(listing), listing, None)
+            
+            # 清單已包含名稱，順便建立名稱索引
+            if self.ids_by_name is None:
+                self.ids_by_name = {}
+                for info in listing:
+                    self.ids_by_name.setdefault(info['name'], []).append(info['path_id'])
+            self.listing = listing
+            return listing
+    
+    def current_listing(self):
+        """目前可顯示的紋理資訊（背景提取進行中時為已完成的部分）"""
+        job = self.job
+        if job and job.status == 'running':
+            return job.files()
+        return self.listing
+    
+    def render_texture(self, path_id):
+        """解碼指定紋理並快取為 PNG，回傳 PNG 路徑"""
+        # 已解碼的紋理不需等待環境鎖（背景提取期間也能立即預覽）
+        png_path = self.rendered.get(path_id)
+        if png_path and os.path.exists(png_path):
+            return png_path
+        
+        with self.lock:
+            png_path = self.rendered.get(path_id)
+            if png_path and os.path.exists(png_path):
+                return png_path
+            
+            cached = self._cached(path_id)
+            if cached:
+                self.rendered[path_id] = cached[0]
+                return cached[0]
+            
+            # 尚未儲存的替換直接使用新圖片，不必重新編碼再解碼
+            if path_id in self.pending_images:
+                png_path = os.path.join(self.output_folder, f'{path_id}.png')
+                self.pending_images[path_id].save(png_path)
+                self.rendered[path_id] = png_path
+                return png_path
+            
+            target_obj = self.get_object(path_id)
+            if not target_obj or target_obj.type.name not in TEXTURE_TYPES:
+                return None
+            
+            png_path = os.path.join(self.output_folder, f'{path_id}.png')
+            info = render_object(target_obj, png_path, atlases=self.atlases)
+            if not info:
+                return None
             
+            self.rendered[path_id] = self._store(path_id, png_path, info)
+            return self.rendered[path_id]
+    
+    def export_textures(self, items, workers=None):
+        """
+        依序產生匯出用的 (檔名, PNG 路徑或 PNG 資料)
+        
+        已解碼或已快取的紋理直接使用既有的 PNG，尚未寫入檔案的替換使用記憶體中的新圖片，
+        其餘紋理交給行程池從修改後的檔案解碼，不佔用環境鎖。
+        
+        Args:
+            items (list): 要匯出的紋理資訊（紋理清單的項目）
+            workers (int): 解碼的工作行程數量
+        """
+        if workers is None:
+            workers = app.config['EXTRACT_WORKERS']
+        
+        local = []
+        remaining = []
+        with self.lock:
+            for info in items:
+                path_id = info['path_id']
+                filename = export_filename(info.get('name'), path_id)
+                png_path = self.rendered.get(path_id)
+                if png_path and os.path.exists(png_path):
+                    local.append((filename, png_path))
+                    continue
+                cached = self._cached(path_id)
+                if cached:
+                    local.append((filename, cached[0]))
+                elif path_id in self.pending_images:
+                    local.append((filename, self.pending_images[path_id]))
+                else:
+                    remaining.append(path_id)
+            objects = [self.get_object(path_id) for path_id in remaining]
+            groups = sprite_groups([obj for obj in objects if obj is not None])
+            assets_path = self.modified_file
+        
+        for filename, source in local:
+            if isinstance(source, str):
+                yield filename, source
+            else:
+                buffer = io.BytesIO()
+                source.save(buffer, 'PNG')
+                yield filename, buffer.getvalue()
+        
+        if remaining:
+            for _, filename, data in export_parallel(assets_path, remaining, max(1, workers),
+                                                     app.config['MMAP_LOADING'], groups):
+                yield filename, data
+    
+    def texture_version(self, path_id):
+        """紋理內容的版本：原始內容以資源雜湊表示，每次替換產生新的識別碼"""
+        version = (self.asset_key or '')[:16]
+        revision = self.revisions.get(int(path_id))
+        return f'{version}-{revision}' if revision else version
+    
+    def render_thumbnail(self, path_id):
+        """產生指定紋理的縮圖（有 mipmap 時只解碼較小的層級），回傳縮圖路徑"""
+        thumb_path = self.thumbnails.get(path_id)
+        if thumb_path and os.path.exists(thumb_path):
+            return thumb_path
+        
+        filename = f'{path_id}_thumb.{THUMBNAIL_EXTENSION}'
+        use_cache = self.asset_key and path_id not in self.replaced_ids
+        cached = texture_cache.get_file(self.asset_key, filename) if use_cache else None
+        if cached:
+            self.thumbnails[path_id] = cached
+            return cached
+        
+        thumb_path = os.path.join(self.output_folder, filename)
+        png_path = self.rendered.get(path_id)
+        if png_path and os.path.exists(png_path):
+            # 已有完整 PNG（例如背景提取的結果）時直接縮小，不必等待環境鎖
+            with Image.open(png_path) as image:
+                save_thumbnail(image, thumb_path)
+        else:
+            with self.lock:
+                if path_id in self.pending_images:
+                    # 尚未儲存的替換直接使用新圖片
+                    save_thumbnail(self.pending_images[path_id], thumb_path)
+                else:
+                    target_obj = self.get_object(path_id)
+                    if not target_obj or target_obj.type.name not in TEXTURE_TYPES:
+                        return None
+                    if not render_thumbnail(target_obj, thumb_path, atlases=self.atlases):
+                        return None
+        
+        if use_cache:
+            thumb_path = texture_cache.put_file(self.asset_key, filename, thumb_path)
+        self.thumbnails[path_id] = thumb_path
+        return thumb_path
+    
+    def replace_texture(self, path_id, image_path, commit=None):
+        """替換指定的紋理（延遲儲存模式下只更新記憶體中的物件）"""
+        if commit is None:
+            commit = not app.config['DEFERRED_COMMIT']
+        
+        success, message = self.apply_texture(path_id, image_path)
+        # 原地覆寫的替換已寫入檔案，沒有待儲存的變更
+        if not success or not commit or not self.dirty_ids:
+            return success, message
+        return self.commit()
+    
+    def replace_textures(self, items, commit=None, workers=None, opener=None):
+        """
+        批次替換多個紋理：平行處理圖片，全部套用後只儲存一次
+        
+        items 為 (path_id, 圖片路徑) 的清單，回傳 (每項結果, 儲存是否成功, 儲存訊息)；
+        指定 opener 時圖片來源改以 opener(來源) 開啟（例如 ZIP 中的項目）。
+        """
+        if commit is None:
+            commit = not app.config['DEFERRED_COMMIT']
+        if workers is None:
+            workers = app.config['IMAGE_WORKERS']
+        
+        report = [{'path_id': path_id, 'success': False, 'message': '', 'encode_seconds': None}
+                  for path_id, _ in items]
+        
+        # 先取得所有目標尺寸與編碼參數，圖片處理期間不佔用環境鎖
+        sizes = []
+        targets = []
+        with self.lock:
+            for entry in report:
+                try:
+                    sizes.append(self.target_size(entry['path_id']))
+                    target_obj = self.get_object(entry['path_id'])
+                    targets.append((target_obj, target_obj.read()) if target_obj.type.name == "Texture2D" else None)
+                except Exception as e:
+                    entry['message'] = str(e)
+                    sizes.append(None)
+                    targets.append(None)
+        
+        def prepare(index):
+            if sizes[index] is None:
+                return None
             try:
-                data = obj.read()
-                name = data.name if hasattr(data, 'name') else f'{obj.type.name.lower()}_{obj.path_id}'
-                
-                if hasattr(data, 'image') and data.image:
-                    output_path = os.path.join(OUTPUT_FOLDER, f'{name}.png')
-                    data.image.save(output_path)
-                    
-                    extracted.append({
-                        'name': name,
-                        'type': obj.type.name,
-                        'path_id': obj.path_id,
-                        'path': os.path.basename(output_path)
-                    })
+                source = items[index][1]
+                return load_replacement_image(opener(source) if opener else source, sizes[index])
             except Exception as e:
-                print(f"處理 {obj.type.name} (path_id: {obj.path_id}) 時發生錯誤: {e}")
+                report[index]['message'] = f"讀取圖片時發生錯誤: {e}"
+                return None
+        
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            images = list(executor.map(prepare, range(len(items))))
         
-        return extracted
+        # 編碼階段：一次處理所有 Texture2D，未命中快取的項目平行編碼
+        encoded = texture_encoder.encode_many([
+            encode_request(target[0], target[1], image) if target and image is not None else None
+            for target, image in zip(targets, images)
+        ])
+        
+        with self.lock:
+            for entry, image, encode_result in zip(report, images, encoded):
+                if image is None:
+                    continue
+                if encode_result:
+                    entry['encode_seconds'] = encode_result[1]
+                entry['success'], entry['message'] = self.apply_image(entry['path_id'], image, encode_result)
+            
+            if commit and any(entry['success'] for entry in report):
+                saved, message = self.commit()
+            else:
+                saved, message = True, f"已套用變更（尚有 {len(self.dirty_ids)} 個紋理待儲存）"
+        
+        return report, saved, message
+    
+    def target_size(self, path_id):
+        """取得紋理的目標尺寸 (寬, 高)，不解碼像素"""
+        target_obj = self.get_object(path_id)
+        if not target_obj:
+            raise ValueError("找不到指定的資源 ID")
+        if target_obj.type.name not in TEXTURE_TYPES:
+            raise ValueError(f"指定的資源不是紋理或精靈圖片 (類型: {target_obj.type.name})")
+        info = read_texture_info(target_obj)
+        return info['width'], info['height']
     
-    def replace_texture(self, path_id, image_path):
-        """替換指定的紋理"""
+    def apply_texture(self, path_id, image_path):
+        """載入圖片後更新記憶體中的紋理物件並標記為待儲存"""
         try:
             print(f"開始處理紋理替換...")
             print(f"目標 Path ID: {path_id}")
             print(f"新圖片路徑: {image_path}")
             
+            # 載入新圖片
+            print("載入新圖片...")
+            new_image = load_replacement_image(image_path, self.target_size(path_id))
+        except Exception as e:
+            error_msg = f"替換紋理時發生錯誤: {str(e)}"
+            print(error_msg)
+            return False, error_msg
+        
+        return self.apply_image(path_id, new_image)
+    
+    def apply_image(self, path_id, new_image, encode_result=None):
+        """
+        以已處理好的 RGBA 圖片更新記憶體中的紋理物件並標記為待儲存
+        
+        encode_result 為編碼階段的結果 (資料, 秒數, 是否取自快取)，
+        省略時 Texture2D 在此編碼（同樣使用編碼快取）。
+        """
+        try:
             if not self.unity_env:
                 print("重新載入資源檔案...")
                 self.load_environment()
             
-            # 載入新圖片
-            print("載入新圖片...")
-            new_image = Image.open(image_path)
-            print(f"新圖片大小: {new_image.size}")
-            new_image = new_image.convert('RGBA')
-            
             # 尋找目標紋理
-            target_obj = None
-            for obj in self.unity_env.objects:
-                if obj.path_id == int(path_id):
-                    target_obj = obj
-                    break
-            
+            target_obj = self.get_object(path_id)
             if not target_obj:
                 raise ValueError("找不到指定的資源 ID")
             
-            if target_obj.type.name not in ["Texture2D", "Sprite"]:
+            if target_obj.type.name not in TEXTURE_TYPES:
                 raise ValueError(f"指定的資源不是紋理或精靈圖片 (類型: {target_obj.type.name})")
             
             print(f"開始處理 {target_obj.type.name} (path_id: {path_id})")
@@ -122,6 +674,24 @@ class AssetHandler:
             if not hasattr(data, 'image'):
                 raise ValueError("目標物件沒有圖片資料")
             
+            encoded = None
+            if target_obj.type.name == "Texture2D":
+                if encode_result is None:
+                    encode_result = texture_encoder.encode(*encode_request(target_obj, data, new_image))
+                encoded = encode_result[0]
+                print(f"{describe_encode(encode_result)} (path_id: {path_id})")
+            encode_note = f"（{describe_encode(encode_result)}）" if encode_result else ""
+            
+            # 編碼後大小不變時直接覆寫修改後的檔案，不需重新序列化
+            if encoded is not None and self._patch_in_place(target_obj, data, new_image, encoded):
+                return True, f"大小不變，已直接寫入修改後的檔案{encode_note}"
+            
+            if encoded is not None:
+                # 以原始格式與 mipmap 層數寫回
+                apply_encoded(data, encoded)
+                self._mark_dirty(path_id, new_image, expected_texture(data, encoded))
+                return True, f"已套用變更（尚有 {len(self.dirty_ids)} 個紋理待儲存）{encode_note}"
+            
             # 保存原始設定
             original_settings = {
                 "m_TextureFormat": data.m_TextureFormat,
@@ -133,11 +703,6 @@ class AssetHandler:
                 "m_IsReadable": data.m_IsReadable,
             }
             
-            # 調整圖片大小
-            if data.image and new_image.size != data.image.size:
-                print(f"調整圖片大小從 {new_image.size} 到 {data.image.size}")
-                new_image = new_image.resize(data.image.size)
-            
             print("更新紋理圖片...")
             # 更新圖片
             data.image = new_image
@@ -148,6 +713,7 @@ class AssetHandler:
                 if hasattr(data, key):
                     setattr(data, key, value)
             
+            format_note = ""
             try:
                 print("儲存物件變更...")
                 # 將修改後的數據寫回
@@ -157,52 +723,325 @@ class AssetHandler:
                 # 如果儲存失敗，嘗試使用預設格式
                 data.m_TextureFormat = 4  # RGBA32 format
                 data.save()
+                format_note = "，無法以原始格式儲存，已改用 RGBA32（檔案會變大）"
             
-            # 儲存修改後的檔案
-            print("儲存已編輯的檔案...")
-            if os.path.exists(self.modified_file):
-                print(f"刪除已存在的檔案: {self.modified_file}")
-                os.remove(self.modified_file)
-            
-            print(f"寫入新檔案: {self.modified_file}")
-            with open(self.modified_file, 'wb') as f:
-                file_data = self.unity_env.file.save()
-                f.write(file_data)
-                print(f"檔案儲存成功，大小: {len(file_data)} bytes")
-            
-            # 檢查並複製 .resS 檔案
-            ress_file = self.original_file + '.resS'
-            if os.path.exists(ress_file):
-                output_ress = self.modified_file + '.resS'
-                print(f"複製 .resS 檔案到: {output_ress}")
-                shutil.copy2(ress_file, output_ress)
-            
-            # 重新載入並驗證
-            print("重新載入環境進行驗證...")
-            self.load_environment()
-            for obj in self.unity_env.objects:
-                if obj.path_id == int(path_id):
-                    verify_data = obj.read()
-                    if hasattr(verify_data, 'image') and verify_data.image:
-                        print(f"驗證成功：新圖片大小為 {verify_data.image.size}")
-                        return True, "修改成功"
-            
-            raise ValueError("驗證失敗：找不到更新後的紋理")
+            expected = expected_texture(data) if target_obj.type.name == "Texture2D" else None
+            self._mark_dirty(path_id, new_image, expected)
+            return True, f"已套用變更（尚有 {len(self.dirty_ids)} 個紋理待儲存）{format_note}"
             
         except Exception as e:
             error_msg = f"替換紋理時發生錯誤: {str(e)}"
             print(error_msg)
             print(traceback.format_exc())  # 印出完整的錯誤堆疊
             return False, error_msg
+    
+    def _mark_replaced(self, path_id, new_image):
+        """記錄替換結果，預覽改用新圖片"""
+        path_id = int(path_id)
+        self.replaced_ids.add(path_id)
+        self.pending_images[path_id] = new_image
+        self.rendered.pop(path_id, None)
+        self.thumbnails.pop(path_id, None)
+        self.atlases.clear()
+        self.revisions[path_id] = uuid.uuid4().hex[:12]
+    
+    def _mark_dirty(self, path_id, new_image, expected=None):
+        """記錄替換結果並標記為待儲存，expected 為儲存後驗證的依據（見 expected_texture）"""
+        self.dirty_ids.add(int(path_id))
+        self.expected[int(path_id)] = expected
+        self._mark_replaced(path_id, new_image)
+    
+    def _patch_in_place(self, target_obj, data, new_image, encoded=None):
+        """嘗試以原地覆寫的方式套用替換，成功時回傳 True"""
+        path_id = int(target_obj.path_id)
+        # 尚未儲存的物件在記憶體中的配置已與檔案不同
+        if path_id in self.dirty_ids:
+            return False
+        
+        try:
+            patch = stage_in_place_patch(target_obj, data, new_image,
+                                         os.path.basename(self.modified_file), self.unity_env.file, encoded)
+            if not patch:
+                return False
+            kind, offset, payload = patch
+            target_file = self.modified_file + '.resS' if kind == 'resS' else self.modified_file
+            print(f"編碼後大小不變，直接覆寫 {target_file} 於位移 {offset} ({len(payload)} bytes)")
+            write_patch(target_file, offset, payload)
+        except Exception as e:
+            print(f"無法直接覆寫，改用完整序列化: {e}")
+            return False
+        
+        self._mark_replaced(path_id, new_image)
+        return True
+    
+    def commit(self):
+        """將所有待儲存的變更一次寫入修改後的檔案並驗證"""
+        with self.lock:
+            if not self.dirty_ids:
+                # 原地覆寫的紋理已在檔案中，但已載入的環境仍讀取覆寫前的內容
+                # （硬連結分離後映射也仍指向舊檔案），捨棄環境後預覽改從檔案重新解碼
+                if self.pending_images:
+                    self._drop_environment()
+                    self.pending_images.clear()
+                return True, "沒有待儲存的變更"
+            
+            try:
+                # 儲存修改後的檔案
+                print(f"儲存已編輯的檔案（{len(self.dirty_ids)} 個紋理）: {self.modified_file}")
+                size = save_environment(self.unity_env, self.modified_file)
+                print(f"檔案儲存成功，大小: {size} bytes，記憶體峰值: {format_peak_memory()}")
+                
+                # 檢查 .resS 檔案（已存在時保留，其中可能有原地覆寫的紋理資料）
+                ress_file = self.original_file + '.resS'
+                output_ress = self.modified_file + '.resS'
+                if os.path.exists(ress_file) and not os.path.exists(output_ress):
+                    method = clone_file(ress_file, output_ress)
+                    print(f"已建立 .resS 檔案的副本（{method}）: {output_ress}")
+                
+                # 儲存後物件在檔案中的位置已改變，舊環境不能再用於原地覆寫；
+                # 先釋放舊環境，避免兩份環境同時佔用記憶體
+                self._drop_environment()
+                
+                level = app.config['VERIFY_LEVEL']
+                if level != 'off':
+                    # 只解析新檔案的物件表（延遲讀取），驗證時只讀取替換過的物件
+                    self.load_environment()
+                    checks = {path_id: (self.expected.get(path_id), self.pending_images.get(path_id))
+                              for path_id in sorted(self.dirty_ids)}
+                    errors = verify_saved_file(self.modified_file, checks, level, self.objects_by_id)
+                    failed = [error for error in errors.values() if error]
+                    if failed:
+                        raise ValueError(f"{failed[0]}（共 {len(failed)} 個紋理驗證失敗）")
+                
+                count = len(self.dirty_ids)
+                self.dirty_ids.clear()
+                self.pending_images.clear()
+                self.expected.clear()
+                return True, f"修改成功（已儲存 {count} 個紋理，記憶體峰值 {format_peak_memory()}）"
+                
+            except Exception as e:
+                error_msg = f"儲存檔案時發生錯誤: {str(e)}"
+                print(error_msg)
+                print(traceback.format_exc())
+                return False, error_msg
+
+class JobCancelled(Exception):
+    """背景工作已被取消"""
+
+class ExtractionJob:
+    """
+    背景提取工作
+    
+    在獨立執行緒中複製上傳的檔案並提取紋理（或只列出中繼資料），
+    記錄進度並累積已完成的紋理資訊，供結果頁面逐步顯示。
+    """
+    
+    def __init__(self, handler, main_path, lazy):
+        self.id = uuid.uuid4().hex
+        self.handler = handler
+        self.main_path = main_path
+        self.lazy = lazy
+        self.status = 'running'  # running / done / error
+        self.error = None
+        self.total = 0
+        self.done = 0
+        self.current_path_id = None
+        self.results = []
+        self.started_at = time.time()
+        self.cancelled = False
+        self.lock = threading.Lock()
+    
+    def cancel(self):
+        """要求停止工作，於下一次回報進度時中止"""
+        self.cancelled = True
+    
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def _run(self):
+        try:
+            with self.handler.lock:
+                if self.cancelled:
+                    raise JobCancelled()
+                self.handler.set_files(self.main_path)
+                if self.lazy:
+                    self.handler.list_textures(job=self)
+                else:
+                    self.handler.extract_textures(job=self)
+            self.status = 'done'
+        except Exception as e:
+            if not self.cancelled:
+                print(f"背景提取時發生錯誤: {e}")
+                print(traceback.format_exc())
+                self.error = str(e)
+                self.status = 'error'
+                return
+            # 取消後（包括首頁清空檔案造成的錯誤）不視為失敗；
+            # 取消時未能重置的狀態由工作自行清除，之後已開始新的工作則不處理
+            print(f"背景提取已取消: {self.main_path}")
+            self.status = 'cancelled'
+            if self.handler.job is self:
+                self.handler.reset()
+    
+    def start_phase(self, total):
+        """設定要處理的物件總數"""
+        if self.cancelled:
+            raise JobCancelled()
+        with self.lock:
+            self.total = total
+            self.started_at = time.time()
+    
+    def advance(self, count, infos, path_id):
+        """回報已處理的物件數量與新完成的紋理（工作已取消時中止處理）"""
+        if self.cancelled:
+            raise JobCancelled()
+        with self.lock:
+            self.done += count
+            self.results.extend(infos)
+            if path_id is not None:
+                self.current_path_id = path_id
+    
+    def files(self):
+        """目前已完成的紋理資訊"""
+        with self.lock:
+            return list(self.results)
+    
+    def snapshot(self, since=0):
+        """回傳目前進度，以及從第 since 筆之後新完成的紋理"""
+        with self.lock:
+            elapsed = time.time() - self.started_at
+            remaining = self.total - self.done
+            eta = elapsed / self.done * remaining if self.done and self.status == 'running' else None
+            return {
+                'id': self.id,
+                'status': self.status,
+                'error': self.error,
+                'total': self.total,
+                'done': self.done,
+                'current_path_id': self.current_path_id,
+                'eta': round(eta, 1) if eta is not None else None,
+                'files': self.results[since:],
+                'next': len(self.results)
+            }
+
+class HandlerPool:
+    """
+    以工作階段 ID 保存 AssetHandler
+    
+    已載入環境的估計記憶體總量超過預算時，釋放最久未使用的環境
+    （保留磁碟上的修改檔案），下次存取時再自動重新載入。
+    閒置超過 idle_timeout 的工作階段整個移除，並刪除其上傳、提取與修改的檔案；
+    伺服器重新啟動前留下、已不在集區中的工作階段資料夾也一併清除。
+    """
+    
+    # 檢查閒置工作階段的最短間隔（秒）
+    SWEEP_INTERVAL = 60
+    
+    def __init__(self, memory_budget, idle_timeout):
+        self.memory_budget = memory_budget
+        self.idle_timeout = idle_timeout
+        self.handlers = OrderedDict()  # 工作階段 ID -> AssetHandler，依使用時間由舊到新排列
+        self.last_used = {}  # 工作階段 ID -> 最後使用時間
+        self.last_sweep = 0
+        self.lock = threading.Lock()
+    
+    def get(self, session_id):
+        """取得（或建立）工作階段的 AssetHandler 並標記為最近使用"""
+        now = time.time()
+        with self.lock:
+            handler = self.handlers.get(session_id)
+            if handler is None:
+                handler = AssetHandler(session_id)
+                self.handlers[session_id] = handler
+            self.handlers.move_to_end(session_id)
+            self.last_used[session_id] = now
+            victims = self._select_victims(handler)
+            idle = self._select_idle(now)
+        
+        # 釋放環境可能需要先儲存變更，不在持有集區鎖時進行
+        for victim in victims:
+            victim.unload()
+        if idle is not None:
+            self._discard_idle(idle, now)
+        return handler
+    
+    def _select_victims(self, current):
+        """挑選需要釋放的環境，讓目前的工作階段載入後仍在預算內"""
+        loaded = [handler for handler in self.handlers.values() if handler.unity_env is not None]
+        total = sum(handler.memory_estimate() for handler in loaded)
+        if current.unity_env is None:
+            total += current.memory_estimate()
+        
+        victims = []
+        for handler in loaded:
+            if total <= self.memory_budget:
+                break
+            if handler is current:
+                continue
+            victims.append(handler)
+            total -= handler.memory_estimate()
+        return victims
+    
+    def _select_idle(self, now):
+        """每隔 SWEEP_INTERVAL 從集區移出閒置的工作階段，未到檢查時間時回傳 None"""
+        if now - self.last_sweep < self.SWEEP_INTERVAL:
+            return None
+        self.last_sweep = now
+        idle = []
+        for session_id, handler in list(self.handlers.items()):
+            if now - self.last_used[session_id] <= self.idle_timeout:
+                break  # 其餘的工作階段使用時間更近
+            if handler.job is not None and handler.job.status == 'running':
+                continue
+            del self.handlers[session_id]
+            del self.last_used[session_id]
+            idle.append(handler)
+        return idle
+    
+    def _discard_idle(self, idle, now):
+        """刪除閒置工作階段的檔案，正在處理請求的工作階段放回集區"""
+        for handler in idle:
+            if not handler.discard():
+                with self.lock:
+                    self.handlers.setdefault(handler.session_id, handler)
+                    self.handlers.move_to_end(handler.session_id)
+                    self.last_used[handler.session_id] = now
+        
+        # 不在集區中且已閒置的工作階段資料夾（例如伺服器重新啟動前留下的）
+        with self.lock:
+            active = set(self.handlers)
+        for base in (UPLOAD_FOLDER, OUTPUT_FOLDER, MODIFIED_FOLDER):
+            if not os.path.isdir(base):
+                continue
+            for entry in os.scandir(base):
+                if entry.name in active or not entry.is_dir(follow_symlinks=False):
+                    continue
+                try:
+                    if now - entry.stat(follow_symlinks=False).st_mtime > self.idle_timeout:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                except OSError:
+                    continue
 
 # 全域變數
-asset_handler = AssetHandler()
+handler_pool = HandlerPool(app.config['HANDLER_MEMORY_BUDGET'], app.config['SESSION_IDLE_TIMEOUT'])
+
+def get_asset_handler():
+    """取得目前工作階段的 AssetHandler"""
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+    return handler_pool.get(session['sid'])
 
 @app.route('/')
 def index():
-    # 清空暫存檔案夾
-    for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER]:
+    asset_handler = get_asset_handler()
+    
+    # 重置 AssetHandler 狀態（進行中的背景提取會被取消，不等待它結束）
+    asset_handler.reset()
+    
+    # 清空本工作階段的暫存檔案夾
+    for folder in [asset_handler.upload_folder, asset_handler.output_folder]:
         temp_folder = Path(folder)
+        temp_folder.mkdir(parents=True, exist_ok=True)
         for temp_file in temp_folder.iterdir():
             if temp_file.is_file():
                 temp_file.unlink()
@@ -210,24 +1049,20 @@ def index():
                 shutil.rmtree(temp_file)
 
     # 確保必要的資料夾結構存在
-    for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER]:
+    for folder in [asset_handler.upload_folder, asset_handler.output_folder]:
         temp_folder = Path(folder) / 'temp'
         temp_folder.mkdir(parents=True, exist_ok=True)
 
-    # 重置 AssetHandler 狀態
-    global asset_handler
-    asset_handler.original_file = None
-    asset_handler.modified_file = None
-    asset_handler.unity_env = None
-
     return render_template('index.html')
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
     try:
+        asset_handler = get_asset_handler()
+        
         # 確保上傳資料夾存在
-        Path(UPLOAD_FOLDER).mkdir(parents=True, exist_ok=True)
-        Path(os.path.join(UPLOAD_FOLDER, 'temp')).mkdir(parents=True, exist_ok=True)
+        Path(asset_handler.upload_folder).mkdir(parents=True, exist_ok=True)
+        Path(os.path.join(asset_handler.upload_folder, 'temp')).mkdir(parents=True, exist_ok=True)
 
         if 'file' not in request.files:
             flash('沒有上傳檔案', 'error')
@@ -247,36 +1082,216 @@ def upload_file():
             return redirect(url_for('index'))
         
         # 儲存檔案
-        main_path = os.path.join(UPLOAD_FOLDER, secure_filename(main_file.filename))
+        # 先刪除同名的舊檔案再寫入新檔案，避免截斷以硬連結共用內容的工作副本
+        main_path = os.path.join(asset_handler.upload_folder, secure_filename(main_file.filename))
+        ress_path = main_path + '.resS'
+        for path in (main_path, ress_path):
+            if os.path.lexists(path):
+                os.remove(path)
         main_file.save(main_path)
         
         if ress_file:
-            ress_path = main_path + '.resS'
             ress_file.save(ress_path)
         
-        # 設置檔案並提取紋理
-        asset_handler.set_files(main_path)
-        extracted_files = asset_handler.extract_textures()
+        # 在背景設置檔案並提取紋理（延遲模式只列出中繼資料），結果頁面會逐步顯示
+        job = ExtractionJob(asset_handler, main_path, app.config['LAZY_EXTRACTION'])
+        asset_handler.job = job
+        job.start()
         
-        if not extracted_files:
-            flash('未找到任何可提取的紋理', 'error')
-            return redirect(url_for('index'))
-        
-        return render_template('results.html', files=extracted_files)
+        return render_template('results.html', files=[], job_id=job.id)
         
     except Exception as e:
         flash(f'處理檔案時發生錯誤: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+def get_job(job_id):
+    """取得目前工作階段的背景提取工作"""
+    job = get_asset_handler().job
+    return job if job and job.id == job_id else None
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': '找不到指定的工作'}), 404
+    return jsonify(job.snapshot(request.args.get('since', 0, type=int)))
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': '找不到指定的工作'}), 404
+    since = request.args.get('since', 0, type=int)
+
+    def stream():
+        nonlocal since
+        while True:
+            snapshot = job.snapshot(since)
+            since = snapshot['next']
+            yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            if snapshot['status'] != 'running':
+                break
+            time.sleep(0.5)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# /api/textures 可用的排序欄位
+TEXTURE_SORT_KEYS = {
+    'path_id': lambda info: info['path_id'],
+    'name': lambda info: (info.get('name') or '').lower(),
+    'type': lambda info: info['type'],
+    'format': lambda info: info.get('format') or '',
+    'width': lambda info: info.get('width') or 0,
+    'height': lambda info: info.get('height') or 0,
+    'size': lambda info: (info.get('width') or 0) * (info.get('height') or 0),
+}
+
+def query_textures(listing, args):
+    """
+    依查詢參數篩選紋理清單（/api/textures 與 /export.zip 共用）
+    
+    Raises:
+        ValueError: path_id 不是數字
+    """
+    def split(value):
+        return [item.strip() for item in value.split(',') if item.strip()] if value else None
+    
+    path_ids = split(args.get('path_id'))
+    items = filter_textures(
+        listing,
+        name=args.get('name'),
+        path_ids=[int(path_id) for path_id in path_ids] if path_ids else None,
+        types=split(args.get('type')),
+        formats=split(args.get('format')),
+        min_width=args.get('min_width', 0, type=int),
+        min_height=args.get('min_height', 0, type=int),
+        max_width=args.get('max_width', type=int),
+        max_height=args.get('max_height', type=int)
+    )
+    
+    # q 為通用搜尋：符合 Path ID 或名稱包含關鍵字
+    query = args.get('q', '').strip().lower()
+    if query:
+        items = [info for info in items
+                 if str(info['path_id']) == query or query in (info.get('name') or '').lower()]
+    return items
+
+@app.route('/api/textures')
+def api_textures():
+    """分頁、排序並篩選紋理清單"""
+    args = request.args
+    handler = get_asset_handler()
+    listing = handler.current_listing()
+    
+    try:
+        items = query_textures(listing, args)
+    except ValueError:
+        return jsonify({'error': 'path_id 必須為數字'}), 400
+    
+    sort_key = TEXTURE_SORT_KEYS.get(args.get('sort', 'path_id'), TEXTURE_SORT_KEYS['path_id'])
+    items = sorted(items, key=sort_key, reverse=args.get('order') == 'desc')
+    
+    offset = max(0, args.get('offset', 0, type=int))
+    limit = min(max(1, args.get('limit', 100, type=int)), 1000)
+    return jsonify({
+        'count': len(listing),
+        'total': len(items),
+        'offset': offset,
+        'limit': limit,
+        'items': [dict(info, version=handler.texture_version(info['path_id']))
+                  for info in items[offset:offset + limit]]
+    })
+
+# 已計算的檔案 ETag：路徑 -> (修改時間, 大小, 內容雜湊)
+# (路徑, 修改時間, 大小) -> 內容雜湊，最久未使用的項目超過上限時淘汰
+file_etags = OrderedDict()
+file_etags_lock = threading.Lock()
+FILE_ETAG_CACHE_SIZE = 4096
+
+def file_etag(path):
+    """以內容雜湊作為 ETag，檔案未變動時沿用上次的結果"""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with file_etags_lock:
+        etag = file_etags.get(key)
+        if etag is not None:
+            file_etags.move_to_end(key)
+            return etag
+    etag = hash_file(path)
+    with file_etags_lock:
+        file_etags[key] = etag
+        while len(file_etags) > FILE_ETAG_CACHE_SIZE:
+            file_etags.popitem(last=False)
+    return etag
+
+def send_cached_file(path, immutable=False, **kwargs):
+    """
+    傳送檔案並附上內容雜湊 ETag
+
+    條件式請求（If-None-Match）回應 304，Range 請求回應 206。
+    immutable 為 True 時表示網址已帶有內容版本，允許瀏覽器長期快取；
+    否則每次使用前都需以 ETag 重新驗證。
+    """
+    response = send_file(path, etag=file_etag(path), conditional=True, **kwargs)
+    if immutable:
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def send_texture_file(handler, path_id, path):
+    """傳送紋理圖片，網址的版本參數與目前內容一致時允許長期快取"""
+    version = request.args.get('v')
+    return send_cached_file(path, immutable=bool(version) and version == handler.texture_version(path_id))
+
 @app.route('/view/<path:filename>')
 def view_file(filename):
-    return send_file(os.path.join(OUTPUT_FOLDER, filename))
+    path = safe_join(get_asset_handler().output_folder, filename)
+    if not path or not os.path.isfile(path):
+        return jsonify({'error': '找不到指定的檔案'}), 404
+    return send_cached_file(path)
+
+@app.route('/view/<int(signed=True):path_id>')
+def view_texture(path_id):
+    try:
+        handler = get_asset_handler()
+        png_path = handler.render_texture(path_id)
+        if not png_path:
+            return jsonify({'error': '找不到指定的紋理'}), 404
+        return send_texture_file(handler, path_id, png_path)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/thumb/<int(signed=True):path_id>')
+def view_thumbnail(path_id):
+    try:
+        handler = get_asset_handler()
+        thumb_path = handler.render_thumbnail(path_id)
+        if not thumb_path:
+            return jsonify({'error': '找不到指定的紋理'}), 404
+        return send_texture_file(handler, path_id, thumb_path)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/find')
+def find_texture():
+    name = request.args.get('name', '')
+    if not name:
+        return jsonify({'error': '未指定紋理名稱'}), 400
+    return jsonify({'path_ids': get_asset_handler().find_by_name(name)})
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(texture_cache.stats())
 
 @app.route('/replace_texture', methods=['POST'])
 def handle_texture_replace():
     try:
+        asset_handler = get_asset_handler()
+        
         # 確保臨時資料夾存在
-        temp_folder = Path(os.path.join(UPLOAD_FOLDER, 'temp'))
+        temp_folder = Path(os.path.join(asset_handler.upload_folder, 'temp'))
         temp_folder.mkdir(parents=True, exist_ok=True)
 
         if 'file' not in request.files:
@@ -298,7 +1313,8 @@ def handle_texture_replace():
         file.save(temp_path)
         
         # 替換紋理
-        success, message = asset_handler.replace_texture(path_id, temp_path)
+        with asset_handler.lock:
+            success, message = asset_handler.replace_texture(path_id, temp_path)
         
         # 刪除臨時檔案
         os.remove(temp_path)
@@ -308,13 +1324,169 @@ def handle_texture_replace():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/replace_textures', methods=['POST'])
+def handle_textures_replace():
+    temp_paths = []
+    try:
+        asset_handler = get_asset_handler()
+        temp_folder = Path(os.path.join(asset_handler.upload_folder, 'temp'))
+        temp_folder.mkdir(parents=True, exist_ok=True)
+
+        # path_id（或 name）與 file 欄位依順序一一對應，path_id 空白時以 name（圖片檔名）對應，
+        # 規則與匯入 ZIP 相同（見 AssetHandler.match_image_name）
+        files = request.files.getlist('file')
+        path_ids = request.form.getlist('path_id') or [''] * len(files)
+        names = request.form.getlist('name') or [''] * len(files)
+        if not files:
+            return jsonify({'success': False, 'message': '沒有上傳檔案'}), 400
+        if not len(path_ids) == len(names) == len(files):
+            return jsonify({'success': False, 'message': 'Path ID 與圖片數量不一致'}), 400
+
+        items = []
+        unresolved = []
+        for index, (path_id, name, file) in enumerate(zip(path_ids, names, files)):
+            if not file.filename.lower().endswith(IMAGE_EXTENSIONS):
+                return jsonify({'success': False, 'message': f'第 {index + 1} 項不是圖片檔案'}), 400
+            if not re.fullmatch(r'-?\d+', path_id):
+                matches = asset_handler.match_image_name(name) if name else []
+                if len(matches) != 1:
+                    message = f'檔名 {name} 對應到多個紋理: {matches}' if matches else f'找不到對應 {name} 的紋理'
+                    unresolved.append({'path_id': None, 'name': name, 'success': False, 'message': message})
+                    continue
+                path_id = matches[0]
+            # 以序號區分同名檔案
+            temp_path = os.path.join(temp_folder, f'{index}_{secure_filename(file.filename)}')
+            file.save(temp_path)
+            temp_paths.append(temp_path)
+            items.append((int(path_id), temp_path))
+
+        report, saved, message = asset_handler.replace_textures(items) if items else ([], True, '沒有可替換的紋理')
+        report += unresolved
+        success = saved and bool(report) and all(entry['success'] for entry in report)
+        return jsonify({'success': success, 'message': message, 'results': report})
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+def match_archive_entries(handler, archive):
+    """
+    將 ZIP 中的圖片對應到紋理
+    
+    檔名（不含副檔名）以 AssetHandler.match_image_name 對應。對應到多個紋理、
+    或多個項目對應到同一個紋理時視為不明確，不進行替換。
+    
+    Returns:
+        tuple: (已對應的 [(path_id, 項目名稱)], 找不到的項目, 不明確的項目)
+    """
+    matched = {}  # path_id -> [項目名稱]
+    unmatched = []
+    ambiguous = []
+    with handler.lock:
+        for member in archive.infolist():
+            filename = os.path.basename(member.filename)
+            if member.is_dir() or not filename or filename.startswith('.') or member.filename.startswith('__MACOSX/'):
+                continue
+            stem, extension = os.path.splitext(filename)
+            if extension.lower() not in IMAGE_EXTENSIONS:
+                unmatched.append({'file': member.filename, 'message': '不是圖片檔案'})
+                continue
+            if member.file_size > ARCHIVE_MAX_IMAGE_BYTES:
+                unmatched.append({'file': member.filename, 'message': '圖片檔案過大'})
+                continue
+            
+            candidates = handler.match_image_name(stem)
+            if len(candidates) > 1:
+                ambiguous.append({'file': member.filename, 'candidates': candidates,
+                                  'message': f'檔名 {stem} 對應到多個紋理'})
+                continue
+            if not candidates:
+                unmatched.append({'file': member.filename, 'message': f'找不到對應 {stem} 的紋理'})
+                continue
+            matched.setdefault(candidates[0], []).append(member.filename)
+    
+    items = []
+    for path_id, files in matched.items():
+        if len(files) > 1:
+            ambiguous.extend({'file': file, 'candidates': [path_id],
+                              'message': f'多個圖片對應到同一個紋理 (path_id: {path_id})'} for file in files)
+        else:
+            items.append((path_id, files[0]))
+    return items, unmatched, ambiguous
+
+@app.route('/replace_zip', methods=['POST'])
+def handle_archive_replace():
+    """
+    上傳 ZIP 批次替換紋理
+    
+    圖片依檔名對應到紋理（見 match_archive_entries），直接從壓縮檔平行讀取與處理，
+    全部套用後只儲存一次。回應中列出已對應、找不到與不明確的項目。
+    """
+    try:
+        asset_handler = get_asset_handler()
+        if not asset_handler.modified_file:
+            return jsonify({'success': False, 'message': '尚未上傳資源檔案'}), 400
+        upload = request.files.get('archive')
+        if not upload or not upload.filename:
+            return jsonify({'success': False, 'message': '沒有上傳檔案'}), 400
+        
+        try:
+            archive = zipfile.ZipFile(upload.stream)
+        except zipfile.BadZipFile:
+            return jsonify({'success': False, 'message': '檔案不是有效的 ZIP 壓縮檔'}), 400
+        
+        with archive:
+            items, unmatched, ambiguous = match_archive_entries(asset_handler, archive)
+            if items:
+                report, saved, message = asset_handler.replace_textures(
+                    items, opener=lambda name: io.BytesIO(archive.read(name)))
+            else:
+                report, saved, message = [], True, '沒有可替換的紋理'
+        
+        for entry, (_, filename) in zip(report, items):
+            entry['file'] = filename
+        success = saved and bool(report) and all(entry['success'] for entry in report)
+        return jsonify({
+            'success': success,
+            'message': message,
+            'matched': [{'file': filename, 'path_id': path_id} for path_id, filename in items],
+            'unmatched': unmatched,
+            'ambiguous': ambiguous,
+            'results': report
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/commit', methods=['POST'])
+def commit_changes():
+    try:
+        asset_handler = get_asset_handler()
+        if not asset_handler.modified_file:
+            return jsonify({'success': False, 'message': '尚未上傳資源檔案'}), 400
+        success, message = asset_handler.commit()
+        return jsonify({'success': success, 'message': message}), 200 if success else 500
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/download_modified', methods=['GET'])
 def download_modified():
     try:
+        asset_handler = get_asset_handler()
+        
+        # 先寫入尚未儲存的變更
+        if asset_handler.dirty_ids:
+            success, message = asset_handler.commit()
+            if not success:
+                return jsonify({'error': message}), 500
+        
         if not asset_handler.modified_file or not os.path.exists(asset_handler.modified_file):
             return jsonify({'error': '沒有可下載的修改檔案'}), 404
         
-        return send_file(
+        # 支援 Range 請求，中斷的下載可以續傳
+        return send_cached_file(
             asset_handler.modified_file,
             as_attachment=True,
             download_name=os.path.basename(asset_handler.modified_file),
@@ -323,6 +1495,76 @@ def download_modified():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+class ZipStream:
+    """
+    只能附加寫入的緩衝區
+    
+    沒有 seek/tell 時 zipfile 會在每個項目後寫入資料描述區，
+    因此可以一邊產生 ZIP 一邊取出已寫入的部分傳送。
+    """
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def take(self):
+        """取出目前已寫入的資料"""
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+@app.route('/export.zip')
+def export_zip():
+    """
+    以串流 ZIP 匯出所有紋理（可用與 /api/textures 相同的參數篩選）
+    
+    紋理解碼後立即寫入回應，不在磁碟或記憶體中暫存整個壓縮檔；
+    檔名為「名稱_path_id.png」，同名的紋理不會互相覆蓋。
+    """
+    try:
+        handler = get_asset_handler()
+        if not handler.modified_file or not os.path.exists(handler.modified_file):
+            return jsonify({'error': '尚未上傳資源檔案'}), 404
+        
+        try:
+            items = query_textures(handler.current_listing(), request.args)
+        except ValueError:
+            return jsonify({'error': 'path_id 必須為數字'}), 400
+        if not items:
+            return jsonify({'error': '沒有符合條件的紋理'}), 404
+        
+        # 先寫入尚未儲存的變更，工作行程才能讀到最新的內容
+        if handler.dirty_ids:
+            success, message = handler.commit()
+            if not success:
+                return jsonify({'error': message}), 500
+        
+        def generate():
+            stream = ZipStream()
+            # PNG 已經壓縮過，直接儲存不再壓縮
+            with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+                for filename, source in handler.export_textures(items):
+                    if isinstance(source, str):
+                        archive.write(source, filename)
+                    else:
+                        archive.writestr(filename, source)
+                    yield stream.take()
+            yield stream.take()
+        
+        download_name = os.path.splitext(os.path.basename(handler.modified_file))[0] + '_textures.zip'
+        response = Response(generate(), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     debug_mode = os.environ.get('FLASK_ENV') == 'development'
     app.run(
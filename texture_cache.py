@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+# 計算檔案雜湊時每次讀取的區塊大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _update_digest(digest, path):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+
+
+def hash_file(path):
+    """計算單一檔案的內容雜湊"""
+    digest = hashlib.blake2b(digest_size=16)
+    _update_digest(digest, path)
+    return digest.hexdigest()
+
+
+def hash_bytes(data):
+    """計算記憶體中資料的內容雜湊"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def hash_asset_files(assets_path):
+    """
+    計算資源檔案（含 .resS）的內容雜湊，作為快取的鍵值
+
+    Args:
+        assets_path (str): .assets 檔案路徑
+
+    Returns:
+        str: 十六進位雜湊字串
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    for path in (assets_path, assets_path + '.resS'):
+        if not os.path.exists(path):
+            continue
+        _update_digest(digest, path)
+        # 分隔兩個檔案，避免內容拼接後產生相同雜湊
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class TextureCache:
+    """
+    以內容雜湊定址的已解碼紋理磁碟快取
+
+    目錄結構為 <root>/<資源雜湊>/<path_id>.png 與 <path_id>.json，
+    另有 listing.json 儲存整份紋理清單，以及縮圖等其他衍生檔案。總大小超過上限時，
+    依最近使用時間淘汰最舊的項目。
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # 檔案路徑 -> 大小，依存取時間由舊到新排列
+        self.total_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """啟動時掃描既有快取，依修改時間重建 LRU 順序"""
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(found):
+            self.entries[path] = size
+            self.total_bytes += size
+
+    def _paths(self, asset_key, path_id):
+        folder = os.path.join(self.root, asset_key)
+        return os.path.join(folder, f'{path_id}.png'), os.path.join(folder, f'{path_id}.json')
+
+    def _touch(self, path):
+        """標記為最近使用"""
+        self.entries.move_to_end(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _add(self, path):
+        size = os.path.getsize(path)
+        self.total_bytes += size - self.entries.get(path, 0)
+        self.entries[path] = size
+        self.entries.move_to_end(path)
+
+    def _evict(self):
+        """淘汰最久未使用的項目直到低於大小上限"""
+        while self.total_bytes > self.max_bytes and self.entries:
+            path, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, asset_key, path_id):
+        """
+        取得已快取的紋理
+
+        Returns:
+            tuple: (PNG 路徑, 紋理資訊)，未命中時回傳 None
+        """
+        png_path, meta_path = self._paths(asset_key, path_id)
+        with self.lock:
+            if png_path not in self.entries or meta_path not in self.entries:
+                self.misses += 1
+                return None
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            self._touch(png_path)
+            self._touch(meta_path)
+            self.hits += 1
+            return png_path, info
+
+    def put(self, asset_key, path_id, source_png, info):
+        """
+        將解碼完成的 PNG 與紋理資訊存入快取
+
+        Returns:
+            str: 快取中的 PNG 路徑
+        """
+        png_path, meta_path = self._paths(asset_key, path_id)
+        os.makedirs(os.path.dirname(png_path), exist_ok=True)
+        with self.lock:
+            shutil.copyfile(source_png, png_path)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(info, f, ensure_ascii=False)
+            self._add(png_path)
+            self._add(meta_path)
+            self._evict()
+            # 單一檔案超過上限時會被立即淘汰，改用原始檔案
+            return png_path if png_path in self.entries else source_png
+
+    def get_file(self, asset_key, filename, count=True):
+        """
+        取得與資源檔案相關的快取檔案（例如縮圖）
+
+        Args:
+            count (bool): 是否計入 /cache/stats 的命中統計
+
+        Returns:
+            str: 快取中的檔案路徑，未命中時回傳 None
+        """
+        path = os.path.join(self.root, asset_key, filename)
+        with self.lock:
+            if path not in self.entries or not os.path.exists(path):
+                if count:
+                    self.misses += 1
+                return None
+            self._touch(path)
+            if count:
+                self.hits += 1
+            return path
+
+    def put_file(self, asset_key, filename, source):
+        """
+        將檔案存入快取
+
+        Returns:
+            str: 快取中的檔案路徑，被立即淘汰時回傳原始檔案路徑
+        """
+        path = os.path.join(self.root, asset_key, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            shutil.copyfile(source, path)
+            self._add(path)
+            self._evict()
+            return path if path in self.entries else source
+
+    def put_bytes(self, asset_key, filename, data):
+        """
+        將資料寫入快取（先寫入暫存檔再取代，其他行程不會讀到寫到一半的檔案）
+
+        Returns:
+            str: 快取中的檔案路徑，被立即淘汰時回傳 None
+        """
+        path = os.path.join(self.root, asset_key, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with self.lock:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self._add(path)
+            self._evict()
+            return path if path in self.entries else None
+
+    def get_listing(self, asset_key):
+        """取得已快取的紋理清單，未命中時回傳 None"""
+        path = os.path.join(self.root, asset_key, 'listing.json')
+        with self.lock:
+            if path not in self.entries:
+                self.misses += 1
+                return None
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    listing = json.load(f)
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            self._touch(path)
+            self.hits += 1
+            return listing
+
+    def put_listing(self, asset_key, listing):
+        """儲存紋理清單"""
+        path = os.path.join(self.root, asset_key, 'listing.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(listing, f, ensure_ascii=False)
+            self._add(path)
+            self._evict()
+
+    def stats(self):
+        """回傳命中統計與目前大小"""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes
+            }
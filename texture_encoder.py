@@ -0,0 +1,310 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from UnityPy.export import Texture2DConverter
+from texture_extractor import mipmap_count
+
+# 記憶體中保留的編碼結果總大小上限
+ENCODE_MEMO_BYTES = 256 * 1024 * 1024
+
+# 磁碟快取中存放編碼結果的資料夾名稱
+ENCODE_CACHE_NAMESPACE = 'encoded'
+
+# 可用的 mipmap 縮小濾波器
+MIP_FILTERS = ('box', 'kaiser')
+
+# Kaiser 濾波器：8 個取樣點（對應輸入位置 -3.5 ~ 3.5）的加窗 sinc
+KAISER_TAPS = 8
+KAISER_BETA = 4.0
+_kaiser_offsets = np.arange(KAISER_TAPS) - (KAISER_TAPS - 1) / 2
+KAISER_KERNEL = (np.sinc(_kaiser_offsets / 2) * np.kaiser(KAISER_TAPS, KAISER_BETA)).astype(np.float32)
+KAISER_KERNEL /= KAISER_KERNEL.sum()
+
+
+def srgb_to_linear(values):
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def linear_to_srgb(values):
+    values = np.clip(values, 0.0, 1.0)
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * values ** (1 / 2.4) - 0.055)
+
+
+def _downsample_box(level):
+    """以 2x2 平均縮小一半（長度為 1 的軸不縮小，奇數長度捨去最後一列）"""
+    height, width = level.shape[:2]
+    if height > 1:
+        rows = height // 2 * 2
+        level = (level[0:rows:2] + level[1:rows:2]) * 0.5
+    if width > 1:
+        columns = width // 2 * 2
+        level = (level[:, 0:columns:2] + level[:, 1:columns:2]) * 0.5
+    return level
+
+
+def _downsample_kaiser_axis(level, axis):
+    """沿單一軸以 Kaiser 加窗 sinc 濾波並縮小一半（邊緣以複製延伸）"""
+    length = level.shape[axis]
+    if length <= 1:
+        return level
+    count = length // 2
+    before = KAISER_TAPS // 2 - 1
+    pad = [(0, 0)] * level.ndim
+    pad[axis] = (before, KAISER_TAPS - before)
+    padded = np.pad(level, pad, mode='edge')
+    result = None
+    for tap, weight in enumerate(KAISER_KERNEL):
+        index = [slice(None)] * level.ndim
+        index[axis] = slice(tap, tap + 2 * count, 2)
+        term = padded[tuple(index)] * weight
+        result = term if result is None else result + term
+    return result
+
+
+def _downsample_kaiser(level):
+    return _downsample_kaiser_axis(_downsample_kaiser_axis(level, 0), 1)
+
+
+def build_mip_chain(pixels, mip_count, mip_filter='box', gamma_correct=False, premultiplied=False):
+    """
+    以 NumPy 向量運算由 RGBA 陣列建立完整的 mipmap 鏈
+
+    每一層由上一層的浮點數結果縮小，只在輸出時轉回 8 位元，避免誤差累積。
+
+    Args:
+        pixels (numpy.ndarray): (高, 寬, 4) 的 uint8 RGBA 陣列（第 0 層）
+        mip_count (int): 層數（含第 0 層）
+        mip_filter (str): 'box' 或 'kaiser'
+        gamma_correct (bool): 是否在線性空間中濾波（RGB 視為 sRGB）
+        premultiplied (bool): 是否以預乘 alpha 濾波，避免透明像素的顏色滲入
+
+    Returns:
+        list: 各層的 (高, 寬, 4) uint8 連續陣列
+    """
+    if mip_filter not in MIP_FILTERS:
+        raise ValueError(f"不支援的 mipmap 濾波器: {mip_filter}")
+    downsample = _downsample_kaiser if mip_filter == 'kaiser' else _downsample_box
+
+    levels = [np.ascontiguousarray(pixels, dtype=np.uint8)]
+    if mip_count <= 1:
+        return levels
+
+    level = pixels.astype(np.float32) / 255.0
+    if gamma_correct:
+        level[..., :3] = srgb_to_linear(level[..., :3])
+    if premultiplied:
+        level[..., :3] *= level[..., 3:4]
+
+    for _ in range(mip_count - 1):
+        level = np.clip(downsample(level), 0.0, 1.0)
+        output = level.copy()
+        if premultiplied:
+            alpha = output[..., 3:4]
+            np.divide(output[..., :3], alpha, out=output[..., :3], where=alpha > 0)
+        if gamma_correct:
+            output[..., :3] = linear_to_srgb(output[..., :3])
+        levels.append(np.ascontiguousarray(np.rint(np.clip(output, 0.0, 1.0) * 255.0), dtype=np.uint8))
+    return levels
+
+
+def image_pixels(image):
+    """
+    取得圖片的 RGBA 像素陣列
+
+    之後的雜湊、跨行程傳遞與 mipmap 產生都共用這一份連續記憶體，不再複製。
+
+    Returns:
+        numpy.ndarray: (高, 寬, 4) 的 uint8 連續陣列
+    """
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    return np.ascontiguousarray(np.asarray(image), dtype=np.uint8)
+
+
+def pixels_image(pixels):
+    """以 frombuffer 將 RGBA 陣列包裝為圖片，不複製像素"""
+    return Image.frombuffer('RGBA', (pixels.shape[1], pixels.shape[0]), pixels, 'raw', 'RGBA', 0, 1)
+
+
+def encode_levels(pixels, texture_format, mip_count, platform=0, platform_blob=None,
+                  mip_filter='box', gamma_correct=False, premultiplied=False):
+    """
+    將圖片編碼為指定格式的像素資料（含完整的 mipmap 層級）
+
+    Args:
+        pixels (numpy.ndarray): 已調整為目標尺寸的 RGBA 陣列（見 image_pixels）
+        texture_format: 目標紋理格式
+        mip_count (int): mipmap 層數
+        platform (int): 目標平台
+        platform_blob: 平台特定的排列資訊
+        mip_filter, gamma_correct, premultiplied: mipmap 產生方式（見 build_mip_chain）
+
+    Returns:
+        bytes: 編碼後的資料，無法維持原始格式時回傳 None
+    """
+    levels = build_mip_chain(pixels, mip_count, mip_filter, gamma_correct, premultiplied)
+
+    chunks = []
+    for level in levels:
+        data, encoded_format = Texture2DConverter.image_to_texture2d(
+            pixels_image(level), texture_format, platform, platform_blob)
+        if encoded_format != texture_format:
+            return None
+        chunks.append(data)
+    return b''.join(chunks)
+
+
+def encode_request(obj, texture, image):
+    """
+    建立 Texture2D 的編碼請求
+
+    Returns:
+        tuple: (RGBA 像素陣列, 格式, mipmap 層數, 平台, platform blob)
+    """
+    return (image_pixels(image), texture.m_TextureFormat, mipmap_count(texture),
+            getattr(obj, 'platform', 0), getattr(texture, 'm_PlatformBlob', None))
+
+
+def _encode_in_worker(pixels, texture_format, mip_count, platform, platform_blob, mip_options):
+    """在工作行程中編碼，回傳 (資料, 秒數)"""
+    started = time.perf_counter()
+    data = encode_levels(pixels, texture_format, mip_count, platform, platform_blob, **mip_options)
+    return data, time.perf_counter() - started
+
+
+class TextureEncoder:
+    """
+    替換圖片的編碼階段
+
+    編碼結果以 (圖片內容雜湊, 格式, 尺寸, mipmap 層數, 平台, mipmap 產生方式) 為鍵記憶；
+    提供 cache（TextureCache）時也寫入磁碟，跨次執行套用相同圖片不必重新編碼。
+    批次編碼時未命中的項目以行程池平行處理。
+    """
+
+    def __init__(self, cache=None, workers=None, memo_bytes=ENCODE_MEMO_BYTES,
+                 mip_filter='box', gamma_correct=False, premultiplied=False):
+        if mip_filter not in MIP_FILTERS:
+            raise ValueError(f"不支援的 mipmap 濾波器: {mip_filter}")
+        self.cache = cache
+        self.workers = workers or os.cpu_count() or 1
+        self.mip_options = {'mip_filter': mip_filter, 'gamma_correct': gamma_correct,
+                            'premultiplied': premultiplied}
+        self.memo_bytes = memo_bytes
+        self.memo = OrderedDict()  # 鍵 -> 編碼後資料，依使用時間由舊到新排列
+        self.memo_total = 0
+        self.lock = threading.Lock()
+
+    def key(self, pixels, texture_format, mip_count, platform=0, platform_blob=None):
+        """計算編碼結果的快取鍵（直接對像素陣列的記憶體計算雜湊，不複製）"""
+        digest = hashlib.blake2b(digest_size=20)
+        options = self.mip_options
+        height, width = pixels.shape[:2]
+        digest.update(f'RGBA:{width}x{height}:{int(texture_format)}:'
+                      f'{mip_count}:{int(platform or 0)}:{options["mip_filter"]}:'
+                      f'{int(options["gamma_correct"])}:{int(options["premultiplied"])}'.encode())
+        if platform_blob:
+            digest.update(bytes(platform_blob))
+        digest.update(pixels)
+        return digest.hexdigest()
+
+    def _lookup(self, key):
+        with self.lock:
+            data = self.memo.get(key)
+            if data is not None:
+                self.memo.move_to_end(key)
+                return data
+        if self.cache is not None:
+            path = self.cache.get_file(ENCODE_CACHE_NAMESPACE, f'{key}.bin', count=False)
+            if path:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                self._remember(key, data, persist=False)
+                return data
+        return None
+
+    def _remember(self, key, data, persist=True):
+        with self.lock:
+            if key not in self.memo:
+                self.memo[key] = data
+                self.memo_total += len(data)
+            while self.memo_total > self.memo_bytes and self.memo:
+                _, evicted = self.memo.popitem(last=False)
+                self.memo_total -= len(evicted)
+        if persist and self.cache is not None:
+            self.cache.put_bytes(ENCODE_CACHE_NAMESPACE, f'{key}.bin', data)
+
+    def encode(self, pixels, texture_format, mip_count, platform=0, platform_blob=None):
+        """
+        編碼單一圖片
+
+        Returns:
+            tuple: (編碼後資料或 None, 編碼秒數, 是否取自快取)
+        """
+        return self.encode_many([(pixels, texture_format, mip_count, platform, platform_blob)])[0]
+
+    def encode_many(self, requests):
+        """
+        批次編碼
+
+        Args:
+            requests (list): encode_request 格式的請求，None 表示略過該項
+
+        Returns:
+            list: 與 requests 對應的 (編碼後資料或 None, 編碼秒數, 是否取自快取)，略過的項目為 None
+        """
+        results = [None] * len(requests)
+        misses = []
+        for index, request in enumerate(requests):
+            if request is None:
+                continue
+            started = time.perf_counter()
+            key = self.key(*request)
+            data = self._lookup(key)
+            if data is not None:
+                results[index] = (data, time.perf_counter() - started, True)
+            else:
+                misses.append((index, key))
+
+        if len(misses) > 1 and self.workers > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(misses))) as executor:
+                futures = []
+                for index, key in misses:
+                    pixels, texture_format, mip_count, platform, platform_blob = requests[index]
+                    futures.append(executor.submit(
+                        _encode_in_worker, pixels, int(texture_format), mip_count, platform,
+                        bytes(platform_blob) if platform_blob else None, self.mip_options))
+                encoded = [future.result() for future in futures]
+        else:
+            encoded = []
+            for index, _ in misses:
+                started = time.perf_counter()
+                encoded.append((encode_levels(*requests[index], **self.mip_options),
+                                time.perf_counter() - started))
+
+        for (index, key), (data, seconds) in zip(misses, encoded):
+            if data is not None:
+                self._remember(key, data)
+            results[index] = (data, seconds, False)
+        return results
+
+    def stats(self):
+        """回傳記憶體中的編碼結果數量與大小"""
+        with self.lock:
+            return {'entries': len(self.memo), 'bytes': self.memo_total}
+
+
+def describe_encode(result):
+    """將編碼結果轉為簡短說明"""
+    if result is None:
+        return ''
+    data, seconds, cached = result
+    if data is None:
+        return '無法以原始格式編碼'
+    if cached:
+        return '使用快取的編碼結果'
+    return f'編碼 {seconds:.2f} 秒'
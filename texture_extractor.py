@@ -0,0 +1,1034 @@
+import UnityPy
+import argparse
+import fnmatch
+import io
+import itertools
+import json
+import mmap
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageDraw, features
+from UnityPy.enums import TextureFormat
+from UnityPy.export import SpriteHelper, Texture2DConverter
+
+# 可提取圖片的資源類型
+TEXTURE_TYPES = ["Texture2D", "Sprite"]
+
+# 縮圖的最大邊長（表格顯示 48px，保留高解析度螢幕所需的餘裕）
+THUMBNAIL_SIZE = 128
+
+# 縮圖格式：Pillow 支援時使用 WebP（保留透明度且檔案小），否則使用 PNG
+THUMBNAIL_FORMAT = 'WEBP' if features.check('webp') else 'PNG'
+THUMBNAIL_EXTENSION = THUMBNAIL_FORMAT.lower()
+
+# 各紋理格式的 (區塊寬, 區塊高, 每區塊位元組數)，用來計算 mipmap 層級在像素資料中的位置
+FORMAT_BLOCKS = {
+    'Alpha8': (1, 1, 1), 'R8': (1, 1, 1),
+    'ARGB4444': (1, 1, 2), 'RGBA4444': (1, 1, 2), 'RGB565': (1, 1, 2),
+    'R16': (1, 1, 2), 'RG16': (1, 1, 2), 'RHalf': (1, 1, 2),
+    'RGB24': (1, 1, 3),
+    'RGBA32': (1, 1, 4), 'ARGB32': (1, 1, 4), 'BGRA32': (1, 1, 4), 'RGHalf': (1, 1, 4), 'RFloat': (1, 1, 4),
+    'RGBAHalf': (1, 1, 8), 'RGFloat': (1, 1, 8),
+    'RGBAFloat': (1, 1, 16),
+    'DXT1': (4, 4, 8), 'BC4': (4, 4, 8), 'ETC_RGB4': (4, 4, 8), 'ETC2_RGB': (4, 4, 8),
+    'ETC2_RGBA1': (4, 4, 8), 'EAC_R': (4, 4, 8), 'EAC_R_SIGNED': (4, 4, 8),
+    'DXT5': (4, 4, 16), 'BC5': (4, 4, 16), 'BC6H': (4, 4, 16), 'BC7': (4, 4, 16),
+    'ETC2_RGBA8': (4, 4, 16), 'EAC_RG': (4, 4, 16), 'EAC_RG_SIGNED': (4, 4, 16),
+}
+
+# 同時保留在記憶體中的已解碼圖集數量（Sprite 依圖集排序處理時一個就夠）
+ATLAS_CACHE_SIZE = 2
+
+# Sprite 打包旋轉（SpritePackingRotation）對應的轉換
+SPRITE_ROTATIONS = {
+    1: Image.FLIP_LEFT_RIGHT,
+    2: Image.FLIP_TOP_BOTTOM,
+    3: Image.ROTATE_180,
+    4: Image.ROTATE_270,
+}
+
+# 提取輸出格式 -> 副檔名（raw 為未壓縮的 RGBA 像素，尺寸記錄於索引中）
+OUTPUT_FORMATS = {'png': 'png', 'webp': 'webp', 'raw': 'rgba'}
+
+# 匯出時每個區段的紋理數量上限（區段的 PNG 會一起回傳，限制主行程暫存的大小）
+EXPORT_SHARD_SIZE = 16
+
+# 工作行程各自持有的 Unity 環境與 path_id 索引
+_worker_env = None
+_worker_objects = None
+
+
+def map_file(path):
+    """
+    以唯讀記憶體映射開啟檔案，回傳可零複製切片的 memoryview
+
+    映射期間檔案被取代（os.replace）仍會保留原本的內容；
+    以 write 覆寫的位元組則會直接反映在映射中。
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def open_environment(assets_path, mapped=False):
+    """
+    載入 Unity 環境
+
+    mapped 為 True 時 .assets 與對應的 .resS 都以記憶體映射載入，
+    紋理資料以 memoryview 切片讀取，實際佔用的記憶體只與讀取過的紋理有關，
+    由作業系統的分頁快取負責淘汰。
+
+    Args:
+        assets_path (str): .assets 檔案路徑
+        mapped (bool): 是否使用記憶體映射
+
+    Returns:
+        UnityPy.Environment: 載入後的環境
+    """
+    if not mapped:
+        return UnityPy.load(assets_path)
+
+    env = UnityPy.Environment()
+    env.path = os.path.dirname(os.path.abspath(assets_path))
+
+    # 先登記 .resS，串流紋理會依名稱從環境中找到它
+    ress_path = assets_path + '.resS'
+    if os.path.exists(ress_path):
+        env.load_file(map_file(ress_path), name=os.path.basename(ress_path))
+    # 與 UnityPy.load 相同，以 env.file 指向主要的 .assets，存檔時由它重新序列化
+    env.file = env.load_file(map_file(assets_path), name=os.path.basename(assets_path))
+    return env
+
+
+def object_name(data):
+    """取得物件資料的名稱欄位（新版 UnityPy 為 m_Name，舊版為 name），沒有時回傳 None"""
+    name = getattr(data, 'm_Name', None)
+    return name if name is not None else getattr(data, 'name', None)
+
+
+def texture_name(obj, data):
+    """取得紋理名稱，沒有名稱時以類型與 path_id 命名"""
+    name = object_name(data)
+    return name if name is not None else f'{obj.type.name.lower()}_{obj.path_id}'
+
+
+def format_name(texture_format):
+    """
+    取得紋理格式名稱
+
+    舊版 UnityPy 的 m_TextureFormat 是 TextureFormat 列舉，新版則是整數，一律轉為列舉名稱；
+    UnityPy 不認得的格式以數字字串表示。
+    """
+    try:
+        return TextureFormat(int(texture_format)).name
+    except ValueError:
+        return str(texture_format)
+
+
+def peek_object_name(obj):
+    """讀取物件名稱，UnityPy 支援時只解析名稱欄位而不讀取整個物件"""
+    if hasattr(obj, 'peek_name'):
+        return obj.peek_name()
+    return object_name(obj.read())
+
+
+def read_texture_info(obj, data=None):
+    """
+    從物件欄位讀取紋理資訊，不解碼像素資料
+
+    Args:
+        obj: UnityPy 的物件讀取器
+        data: 已讀取的物件資料（可省略）
+
+    Returns:
+        dict: 包含 name、type、path_id、width、height、format 的紋理資訊
+    """
+    if data is None:
+        data = obj.read()
+
+    if obj.type.name == "Sprite":
+        # Sprite 的尺寸取自其在圖集中的矩形，格式由背後的 Texture2D 決定
+        rect = data.m_Rect
+        width, height = int(rect.width), int(rect.height)
+        texture_format = ''
+    else:
+        width, height = data.m_Width, data.m_Height
+        texture_format = format_name(data.m_TextureFormat)
+
+    return {
+        'name': texture_name(obj, data),
+        'type': obj.type.name,
+        'path_id': obj.path_id,
+        'width': width,
+        'height': height,
+        'format': texture_format
+    }
+
+
+def mipmap_count(texture):
+    """取得紋理的 mipmap 層數（舊版 Unity 只有 m_MipMap 旗標）"""
+    count = getattr(texture, 'm_MipCount', None)
+    if count:
+        return count
+    if getattr(texture, 'm_MipMap', False):
+        return max(texture.m_Width, texture.m_Height).bit_length()
+    return 1
+
+
+def format_blocks(texture_format):
+    """
+    取得紋理格式的區塊大小
+
+    Returns:
+        tuple: (區塊寬, 區塊高, 每區塊位元組數)，不支援的格式（如 Crunched、PVRTC）回傳 None
+    """
+    name = format_name(texture_format)
+    if name in FORMAT_BLOCKS:
+        return FORMAT_BLOCKS[name]
+    match = re.match(r'ASTC_.*?(\d+)x(\d+)$', name)
+    if match:
+        return int(match.group(1)), int(match.group(2)), 16
+    return None
+
+
+def mip_level_size(blocks, width, height):
+    """計算單一 mipmap 層級的位元組數"""
+    block_width, block_height, block_bytes = blocks
+    return -(-width // block_width) * -(-height // block_height) * block_bytes
+
+
+def texture_data(texture):
+    """取得紋理的完整像素資料（含串流於 .resS 中的資料）"""
+    # 新版 UnityPy 的 image_data 只有內嵌資料，串流資料需由 get_image_data 讀取
+    if hasattr(texture, 'get_image_data'):
+        return texture.get_image_data()
+    return texture.image_data
+
+
+def decode_mip_level(obj, texture, max_size):
+    """
+    解碼不小於 max_size 的最小 mipmap 層級
+
+    只有格式可計算層級位置、且沒有平台特定排列（platform blob）時才適用。
+
+    Returns:
+        PIL.Image: 解碼後的圖片，無法只解碼部分層級時回傳 None
+    """
+    levels = mipmap_count(texture)
+    blocks = format_blocks(texture.m_TextureFormat)
+    platform_blob = getattr(texture, 'm_PlatformBlob', None)
+    if levels <= 1 or not blocks or platform_blob:
+        return None
+
+    width, height = texture.m_Width, texture.m_Height
+    offset = 0
+    for _ in range(levels - 1):
+        if max(width, height) // 2 < max_size:
+            break
+        offset += mip_level_size(blocks, width, height)
+        width, height = max(1, width // 2), max(1, height // 2)
+    if offset == 0:
+        return None
+
+    size = mip_level_size(blocks, width, height)
+    image_data = texture_data(texture)
+    if len(image_data) < offset + size:
+        return None
+    return Texture2DConverter.parse_image_data(
+        bytes(image_data[offset:offset + size]), width, height, texture.m_TextureFormat,
+        obj.version, getattr(obj, 'platform', 0), platform_blob)
+
+
+def save_thumbnail(image, output_path, size=THUMBNAIL_SIZE):
+    """將圖片縮小到 size 以內並以縮圖格式儲存"""
+    image = image.copy()
+    image.thumbnail((size, size), Image.BOX)
+    if THUMBNAIL_FORMAT == 'WEBP':
+        image.save(output_path, 'WEBP', quality=80, method=4)
+    else:
+        image.save(output_path, THUMBNAIL_FORMAT, optimize=True)
+
+
+def render_thumbnail(obj, output_path, size=THUMBNAIL_SIZE, data=None, atlases=None):
+    """
+    產生紋理縮圖
+
+    有 mipmap 的 Texture2D 只解碼接近縮圖大小的層級，其餘情況解碼完整圖片後縮小。
+
+    Args:
+        obj: UnityPy 的物件讀取器
+        output_path (str): 縮圖輸出路徑
+        size (int): 縮圖最大邊長
+        data: 已讀取的物件資料（可省略）
+        atlases (AtlasCache): 圖集快取（可省略）
+
+    Returns:
+        bool: 是否成功產生縮圖
+    """
+    if data is None:
+        data = obj.read()
+
+    image = None
+    if obj.type.name == "Texture2D":
+        try:
+            image = decode_mip_level(obj, data, size)
+        except Exception as e:
+            print(f"解碼 Texture2D (path_id: {obj.path_id}) 的 mipmap 層級失敗，改用完整圖片: {e}")
+    if image is None:
+        image = decode_image(obj, data, atlases)
+    if not image:
+        return False
+
+    save_thumbnail(image, output_path, size)
+    return True
+
+
+def list_textures(objects, progress=None):
+    """
+    建立紋理清單（只讀取中繼資料，不解碼）
+
+    Args:
+        objects: UnityPy 的物件讀取器序列
+        progress: 每處理一個物件呼叫一次 progress(處理數量, 新增的紋理資訊, path_id)
+
+    Returns:
+        list: 紋理資訊
+    """
+    listing = []
+    for obj in objects:
+        if obj.type.name not in TEXTURE_TYPES:
+            continue
+        infos = []
+        try:
+            infos.append(read_texture_info(obj))
+        except Exception as e:
+            print(f"讀取 {obj.type.name} (path_id: {obj.path_id}) 資訊時發生錯誤: {e}")
+        listing.extend(infos)
+        if progress:
+            progress(1, infos, obj.path_id)
+    return listing
+
+
+def select_objects(objects, name=None, path_ids=None, types=None, formats=None, min_width=0, min_height=0):
+    """
+    依中繼資料挑選要提取的紋理物件，不解碼任何像素
+
+    類型與 path_id 直接由物件讀取器判斷，名稱在 UnityPy 支援時只解析名稱欄位，
+    只有通過前述條件的物件才讀取尺寸與格式。
+
+    Returns:
+        tuple: (物件讀取器清單, 對應的紋理資訊清單)
+    """
+    types = set(types or TEXTURE_TYPES) & set(TEXTURE_TYPES)
+    path_ids = set(path_ids) if path_ids else None
+    candidates = [obj for obj in objects
+                  if obj.type.name in types and (path_ids is None or obj.path_id in path_ids)]
+    peeked = name and candidates and hasattr(candidates[0], 'peek_name')
+    if peeked:
+        # 只解析名稱欄位即可排除大部分物件（沒有名稱時與 texture_name 相同以類型與 path_id 命名）
+        names = []
+        for obj in candidates:
+            obj_name = peek_object_name(obj)
+            if obj_name is None:
+                obj_name = f'{obj.type.name.lower()}_{obj.path_id}'
+            names.append({'name': obj_name, 'path_id': obj.path_id})
+        kept = {info['path_id'] for info in filter_textures(names, name)}
+        candidates = [obj for obj in candidates if obj.path_id in kept]
+
+    by_id = {obj.path_id: obj for obj in candidates}
+    # 名稱已在上一步篩選過，不再以完整讀取的名稱重複比對
+    infos = filter_textures(list_textures(candidates), name=None if peeked else name, formats=formats,
+                            min_width=min_width, min_height=min_height)
+    return [by_id[info['path_id']] for info in infos], infos
+
+
+def filter_textures(infos, name=None, path_ids=None, types=None, formats=None,
+                    min_width=0, min_height=0, max_width=None, max_height=None):
+    """
+    依中繼資料篩選紋理（不需解碼像素）
+
+    Args:
+        infos: read_texture_info 格式的紋理資訊
+        name (str): 名稱條件，含萬用字元（* ? [）時以 glob 比對，否則為部分比對，皆不分大小寫
+        path_ids: 允許的 path_id
+        types: 允許的類型（Texture2D、Sprite）
+        formats: 允許的紋理格式名稱（不分大小寫）
+        min_width, min_height (int): 最小尺寸
+        max_width, max_height (int): 最大尺寸
+
+    Returns:
+        list: 符合條件的紋理資訊（保持原順序）
+    """
+    if name:
+        pattern = name.lower()
+        if any(char in pattern for char in '*?['):
+            match_name = lambda value: fnmatch.fnmatchcase(value.lower(), pattern)
+        else:
+            match_name = lambda value: pattern in value.lower()
+    path_ids = set(path_ids) if path_ids else None
+    types = set(types) if types else None
+    formats = {value.lower() for value in formats} if formats else None
+
+    matched = []
+    for info in infos:
+        if path_ids is not None and info['path_id'] not in path_ids:
+            continue
+        if types is not None and info['type'] not in types:
+            continue
+        if formats is not None and (info.get('format') or '').lower() not in formats:
+            continue
+        width, height = info.get('width') or 0, info.get('height') or 0
+        if width < min_width or height < min_height:
+            continue
+        if (max_width is not None and width > max_width) or (max_height is not None and height > max_height):
+            continue
+        if name and not match_name(info.get('name') or ''):
+            continue
+        matched.append(info)
+    return matched
+
+
+class AtlasCache:
+    """
+    已解碼圖集的 LRU 快取
+
+    圖集以未翻轉的方向（Unity 的原始方向）保存，key 為 sprite_atlas_key 的結果。
+    """
+
+    def __init__(self, max_items=ATLAS_CACHE_SIZE):
+        self.max_items = max_items
+        self.images = OrderedDict()
+
+    def peek(self, key):
+        """取得已解碼的圖集，未快取時回傳 None（不會解碼）"""
+        image = self.images.get(key)
+        if image is not None:
+            self.images.move_to_end(key)
+        return image
+
+    def get(self, key, texture_ptr):
+        """取得圖集，未快取時解碼 texture_ptr 指向的 Texture2D"""
+        image = self.peek(key)
+        if image is None:
+            image = Texture2DConverter.get_image_from_texture2d(texture_ptr.read(), False)
+            self.images[key] = image
+            while len(self.images) > self.max_items:
+                self.images.popitem(last=False)
+        return image
+
+    def clear(self):
+        self.images.clear()
+
+    def nbytes(self):
+        """估計已解碼圖集佔用的記憶體"""
+        return sum(image.width * image.height * len(image.getbands()) for image in list(self.images.values()))
+
+
+def sprite_atlas_key(data):
+    """
+    取得 Sprite 背後圖集 Texture2D 的 (file_id, path_id)
+
+    使用 SpriteAtlas 或分離的 Alpha 貼圖時回傳 None，交由 UnityPy 的完整流程處理。
+    """
+    if getattr(getattr(data, 'm_SpriteAtlas', None), 'path_id', 0) or getattr(data, 'm_AtlasTags', None):
+        return None
+    render_data = data.m_RD
+    if getattr(render_data.alphaTexture, 'path_id', 0):
+        return None
+    texture = render_data.texture
+    if not texture.path_id:
+        return None
+    return texture.file_id, texture.path_id
+
+
+def sprite_settings(render_data):
+    """取得 Sprite 的打包設定（新版 UnityPy 的 settingsRaw 是未解析的整數）"""
+    settings = render_data.settingsRaw
+    if isinstance(settings, int):
+        settings = SpriteHelper.SpriteSettings(settings)
+    return settings
+
+
+def crop_sprite(data, atlas):
+    """
+    從未翻轉的圖集裁切 Sprite
+
+    依打包設定處理旋轉與 Tight 模式的多邊形遮罩，結果與 UnityPy 的 data.image 相同。
+    """
+    render_data = data.m_RD
+    rect = render_data.textureRect
+    settings = sprite_settings(render_data)
+    image = atlas.crop((rect.x, rect.y, rect.x + rect.width, rect.y + rect.height))
+
+    if settings.packed and settings.packingRotation in SPRITE_ROTATIONS:
+        image = image.transpose(SPRITE_ROTATIONS[settings.packingRotation])
+
+    if settings.packingMode == 0 and not hasattr(SpriteHelper, 'get_triangles'):
+        # 新版 UnityPy 以網格處理 Tight 打包：有 UV 時從圖集重新繪製三角形，否則以頂點遮罩
+        from UnityPy.helpers.MeshHelper import MeshHandler
+        mesh = MeshHandler(render_data, data.object_reader.version)
+        mesh.process()
+        if mesh.m_UV0 and any(u or v for u, v in mesh.m_UV0):
+            image = SpriteHelper.render_sprite_mesh(data, mesh, atlas)
+        else:
+            image = SpriteHelper.mask_sprite(data, mesh, image)
+    elif settings.packingMode == 0:
+        # Tight 打包只保留網格覆蓋的多邊形
+        mask = Image.new("1", image.size, color=0)
+        draw = ImageDraw.ImageDraw(mask)
+        for triangle in SpriteHelper.get_triangles(data):
+            draw.polygon(triangle, fill=1)
+        if image.mode == "RGBA":
+            image = Image.composite(image, Image.new(image.mode, image.size, color=0), mask)
+        else:
+            image.putalpha(mask)
+
+    return image.transpose(Image.FLIP_TOP_BOTTOM)
+
+
+def decode_image(obj, data, atlases=None):
+    """
+    解碼物件的圖片
+
+    提供 atlases 時 Sprite 從快取的圖集裁切，同一圖集只解碼一次；
+    已作為圖集解碼過的 Texture2D 也直接沿用。
+    """
+    if atlases is not None:
+        if obj.type.name == "Sprite":
+            key = sprite_atlas_key(data)
+            if key is not None:
+                try:
+                    return crop_sprite(data, atlases.get(key, data.m_RD.texture))
+                except Exception as e:
+                    # 裁切失敗（例如不支援的網格）時改由 UnityPy 完整解碼，不放棄這個 Sprite
+                    print(f"從圖集裁切 Sprite (path_id: {obj.path_id}) 失敗，改用完整解碼: {e}")
+        else:
+            atlas = atlases.peek((0, obj.path_id))
+            if atlas is not None:
+                return atlas.transpose(Image.FLIP_TOP_BOTTOM)
+    # data.image 每次存取都會重新解碼，只取一次
+    return data.image if hasattr(data, 'image') else None
+
+
+def render_object(obj, output_path, data=None, atlases=None):
+    """
+    解碼單一紋理物件並儲存為 PNG
+
+    Args:
+        obj: UnityPy 的物件讀取器
+        output_path (str): PNG 輸出路徑
+        data: 已讀取的物件資料（可省略）
+        atlases (AtlasCache): 圖集快取（可省略）
+
+    Returns:
+        dict: 紋理資訊，物件沒有圖片時回傳 None
+    """
+    if data is None:
+        data = obj.read()
+
+    image = decode_image(obj, data, atlases)
+    if not image:
+        return None
+    return save_image(obj, data, image, output_path)
+
+
+def write_image(image, output_path, output_format='png', compress_level=None, quality=None):
+    """
+    以指定格式寫入圖片
+
+    Args:
+        image (PIL.Image.Image): 圖片
+        output_path (str): 輸出路徑
+        output_format (str): OUTPUT_FORMATS 之一
+        compress_level (int): PNG 壓縮等級 0-9（None 為 Pillow 預設）
+        quality (int): WebP 品質 0-100（None 為無失真）
+    """
+    if output_format == 'raw':
+        with open(output_path, 'wb') as f:
+            f.write(image.convert('RGBA').tobytes())
+    elif output_format == 'webp':
+        if quality is None:
+            image.save(output_path, 'WEBP', lossless=True)
+        else:
+            image.save(output_path, 'WEBP', quality=quality)
+    elif compress_level is not None:
+        image.save(output_path, 'PNG', compress_level=compress_level)
+    else:
+        image.save(output_path)
+
+
+def save_image(obj, data, image, output_path, output_options=None):
+    """儲存已解碼的圖片並回傳紋理資訊（output_options 為 write_image 的參數）"""
+    output_options = output_options or {}
+    write_image(image, output_path, **output_options)
+
+    info = read_texture_info(obj, data)
+    info['path'] = os.path.basename(output_path)
+    if output_options.get('output_format') == 'raw':
+        info['pixel_format'] = 'RGBA'
+        info['pixel_size'] = list(image.size)
+    return info
+
+
+def export_filename(name, path_id, extension='png'):
+    """以紋理名稱加上 path_id 作為輸出檔名（避免同名紋理互相覆蓋）"""
+    name = (name or '').replace('/', '_').replace('\\', '_')
+    return f'{name}_{path_id}.{extension}'
+
+
+def output_filename(obj, data, extension='png'):
+    """物件的輸出檔名（見 export_filename）"""
+    return export_filename(texture_name(obj, data), obj.path_id, extension)
+
+
+def extract_object(obj, output_folder, data=None, atlases=None):
+    """
+    解碼單一紋理物件並以紋理名稱加上 path_id 儲存為 PNG（避免同名紋理互相覆蓋）
+
+    Args:
+        obj: UnityPy 的物件讀取器
+        output_folder (str): PNG 輸出資料夾
+        data: 已讀取的物件資料（可省略）
+        atlases (AtlasCache): 圖集快取（可省略）
+
+    Returns:
+        tuple: (紋理資訊 dict 或 None, 錯誤訊息或 None)
+    """
+    try:
+        if data is None:
+            data = obj.read()
+        output_path = os.path.join(output_folder, output_filename(obj, data))
+        return render_object(obj, output_path, data, atlases), None
+    except Exception as e:
+        return None, f"處理 {obj.type.name} (path_id: {obj.path_id}) 時發生錯誤: {e}"
+
+
+def decode_object(obj, data=None, atlases=None):
+    """
+    解碼單一紋理物件（不寫入檔案）
+
+    Returns:
+        tuple: (obj, 物件資料或 None, 圖片或 None, 錯誤訊息或 None)
+    """
+    try:
+        if data is None:
+            data = obj.read()
+        return obj, data, decode_image(obj, data, atlases), None
+    except Exception as e:
+        return obj, data, None, f"處理 {obj.type.name} (path_id: {obj.path_id}) 時發生錯誤: {e}"
+
+
+def read_sprites(objects):
+    """
+    讀取 Sprite 並依背後圖集排序
+
+    Returns:
+        tuple: ([(圖集 key 或 None, obj, data)], [(obj, 錯誤訊息)])
+    """
+    sprites = []
+    errors = []
+    for obj in objects:
+        try:
+            data = obj.read()
+            sprites.append((sprite_atlas_key(data), obj, data))
+        except Exception as e:
+            errors.append((obj, f"處理 {obj.type.name} (path_id: {obj.path_id}) 時發生錯誤: {e}"))
+    sprites.sort(key=lambda item: item[0] or (-1, 0))
+    return sprites, errors
+
+
+def decode_objects(objects, atlases=None):
+    """
+    依序解碼多個紋理物件
+
+    Sprite 依背後的圖集分組處理，每個圖集只解碼一次，
+    圖集本身的 Texture2D 緊接在該組之後處理並沿用同一份解碼結果。
+
+    Args:
+        objects: UnityPy 的物件讀取器序列
+        atlases (AtlasCache): 圖集快取（可省略，預設每次呼叫各自建立）
+
+    Yields:
+        tuple: (obj, 物件資料或 None, 圖片或 None, 錯誤訊息或 None)
+    """
+    if atlases is None:
+        atlases = AtlasCache()
+
+    objects = list(objects)
+    sprites, errors = read_sprites(obj for obj in objects if obj.type.name == "Sprite")
+    for obj, error in errors:
+        yield obj, None, None, error
+
+    textures = {(0, obj.path_id): obj for obj in objects if obj.type.name != "Sprite"}
+    for key, group in itertools.groupby(sprites, key=lambda item: item[0]):
+        for _, obj, data in group:
+            yield decode_object(obj, data, atlases)
+        texture = textures.pop(key, None) if key else None
+        if texture is not None:
+            yield decode_object(texture, atlases=atlases)
+
+    for obj in textures.values():
+        yield decode_object(obj)
+
+
+def extract_objects(objects, output_folder, atlases=None, output_options=None):
+    """
+    依序解碼多個紋理物件並輸出圖片（處理順序見 decode_objects）
+
+    Args:
+        objects: UnityPy 的物件讀取器序列
+        output_folder (str): 輸出資料夾
+        atlases (AtlasCache): 圖集快取（可省略）
+        output_options (dict): write_image 的參數（省略時輸出 PNG）
+
+    Yields:
+        tuple: (obj, 紋理資訊 dict 或 None, 錯誤訊息或 None)
+    """
+    extension = OUTPUT_FORMATS[(output_options or {}).get('output_format', 'png')]
+    for obj, data, image, error in decode_objects(objects, atlases):
+        if error or not image:
+            yield obj, None, error
+            continue
+        try:
+            output_path = os.path.join(output_folder, output_filename(obj, data, extension))
+            yield obj, save_image(obj, data, image, output_path, output_options), None
+        except Exception as e:
+            yield obj, None, f"處理 {obj.type.name} (path_id: {obj.path_id}) 時發生錯誤: {e}"
+
+
+def sprite_groups(objects):
+    """
+    將共用同一圖集的 Sprite 分組（平行處理時同一組應交給同一個工作行程）
+
+    Returns:
+        list: 每個元素為一組 path_id（包含圖集本身的 Texture2D，若在同一檔案中）
+    """
+    sprites, _ = read_sprites(obj for obj in objects if obj.type.name == "Sprite")
+    groups = []
+    for key, group in itertools.groupby(sprites, key=lambda item: item[0]):
+        if key is None:
+            continue
+        path_ids = [obj.path_id for _, obj, _ in group]
+        if key[0] == 0:
+            path_ids.append(key[1])
+        groups.append(path_ids)
+    return groups
+
+
+def _init_worker(assets_path, mapped):
+    """工作行程初始化：各自載入一份資源檔案並建立 path_id 索引（映射載入時共用分頁快取）"""
+    global _worker_env, _worker_objects
+    _worker_env = open_environment(assets_path, mapped)
+    _worker_objects = {obj.path_id: obj for obj in _worker_env.objects}
+
+
+def _extract_shard(path_ids, output_folder, output_options=None):
+    """在工作行程中解碼一批 path_id 對應的紋理（同一區段內的 Sprite 共用圖集解碼結果）"""
+    results = []
+    objects = []
+    for path_id in path_ids:
+        obj = _worker_objects.get(path_id)
+        if obj is None:
+            results.append((path_id, None, f"工作行程中找不到 path_id: {path_id}"))
+        else:
+            objects.append(obj)
+    for obj, info, error in extract_objects(objects, output_folder, output_options=output_options):
+        results.append((obj.path_id, info, error))
+    return results
+
+
+def _export_shard(path_ids):
+    """在工作行程中解碼一批紋理並編碼為 PNG，回傳 [(path_id, 檔名, PNG 資料, 錯誤訊息)]"""
+    results = []
+    objects = []
+    for path_id in path_ids:
+        obj = _worker_objects.get(path_id)
+        if obj is None:
+            results.append((path_id, None, None, f"工作行程中找不到 path_id: {path_id}"))
+        else:
+            objects.append(obj)
+    for obj, data, image, error in decode_objects(objects):
+        if error or not image:
+            results.append((obj.path_id, None, None, error))
+            continue
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        results.append((obj.path_id, output_filename(obj, data), buffer.getvalue(), None))
+    return results
+
+
+def shard_path_ids(path_ids, shard_count, groups=None):
+    """
+    依 path_id 排序後切成連續區段，讓每個工作行程讀取相鄰的物件
+
+    Args:
+        path_ids (list): 要處理的 path_id
+        shard_count (int): 區段數量
+        groups (list): 必須放在同一區段的 path_id 群組（例如共用圖集的 Sprite）
+
+    Returns:
+        list: 每個元素為一個 path_id 區段
+    """
+    wanted = set(path_ids)
+    if not wanted:
+        return []
+
+    # 每個單位不可拆開：群組或單一 path_id
+    units = []
+    grouped = set()
+    for group in groups or []:
+        members = sorted(path_id for path_id in set(group) if path_id in wanted and path_id not in grouped)
+        if members:
+            grouped.update(members)
+            units.append(members)
+    units.extend([path_id] for path_id in wanted if path_id not in grouped)
+    units.sort(key=lambda unit: unit[0])
+
+    shard_count = max(1, min(shard_count, len(wanted)))
+    size = -(-len(wanted) // shard_count)
+    shards = []
+    current = []
+    for unit in units:
+        current.extend(unit)
+        if len(current) >= size:
+            shards.append(current)
+            current = []
+    if current:
+        shards.append(current)
+    return shards
+
+
+def run_tasks(tasks, workers, initializer=None, initargs=()):
+    """
+    以行程池執行工作，依完成順序逐一產生結果
+
+    工作行程異常結束（例如解碼器崩潰）時，行程池中所有未完成的工作都會收到 BrokenProcessPool，
+    無法得知是哪一個造成的：已完成的結果照常保留，未完成的工作分成兩半各自在新的行程池重新執行，
+    直到單獨執行仍使行程結束的工作才回報失敗，其他工作不受影響。
+
+    Args:
+        tasks (list): (key, 函式, 參數 tuple) 清單
+        workers (int): 工作行程數量
+        initializer, initargs: 每個工作行程的初始化函式與參數
+
+    Yields:
+        tuple: (key, 回傳值, 例外)，成功時例外為 None
+    """
+    calls = {key: (func, args) for key, func, args in tasks}
+    batches = [list(calls)] if calls else []
+    while batches:
+        batch = batches.pop(0)
+        unfinished = []
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(batch))),
+                                 initializer=initializer, initargs=initargs) as executor:
+            futures = {executor.submit(calls[key][0], *calls[key][1]): key for key in batch}
+            try:
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        if len(batch) == 1:
+                            yield key, None, e
+                        else:
+                            unfinished.append(key)
+                        continue
+                    except Exception as e:
+                        yield key, None, e
+                        continue
+                    yield key, result, None
+            finally:
+                # 提前停止迭代（例如工作被取消）時不再等待尚未開始的工作
+                for future in futures:
+                    future.cancel()
+        if unfinished:
+            pending = set(unfinished)
+            unfinished = [key for key in batch if key in pending]
+            print(f"工作行程異常結束，重新執行 {len(unfinished)} 個未完成的工作")
+            middle = (len(unfinished) + 1) // 2
+            batches[:0] = [part for part in (unfinished[:middle], unfinished[middle:]) if part]
+
+
+def extract_parallel(assets_path, path_ids, output_folder, workers, mapped=False, progress=None, groups=None,
+                     output_options=None):
+    """
+    以行程池平行解碼並輸出紋理
+
+    每個工作行程各自載入資源檔案，解碼並編碼 PNG 後只回傳紋理資訊，
+    結果依傳入的 path_id 順序排列，與逐一處理的輸出一致。
+
+    Args:
+        assets_path (str): 資源檔案路徑
+        path_ids (list): 要提取的 path_id（決定輸出順序）
+        output_folder (str): PNG 輸出資料夾
+        workers (int): 工作行程數量
+        mapped (bool): 工作行程是否以記憶體映射載入資源檔案
+        progress: 每完成一個區段呼叫一次 progress(處理數量, 新增的紋理資訊, 最後的 path_id)
+        groups (list): 必須由同一個工作行程處理的 path_id 群組（見 sprite_groups）
+        output_options (dict): write_image 的參數（省略時輸出 PNG）
+
+    Returns:
+        list: 成功提取的紋理資訊
+    """
+    # 每個工作行程切成數個區段，讓較慢的區段不會拖住整體
+    shards = shard_path_ids(path_ids, workers * 4, groups)
+
+    results = {}
+    tasks = [(index, _extract_shard, (shard, output_folder, output_options)) for index, shard in enumerate(shards)]
+    for index, shard_results, error in run_tasks(tasks, workers, _init_worker, (assets_path, mapped)):
+        if error is not None:
+            # 只有這個區段的紋理記為失敗，其他區段照常輸出
+            shard_results = [(path_id, None, f"處理 path_id: {path_id} 時工作行程發生錯誤: {error}")
+                             for path_id in shards[index]]
+        infos = []
+        for path_id, info, error in shard_results:
+            if error:
+                print(error)
+            if info:
+                results[path_id] = info
+                infos.append(info)
+        if progress:
+            progress(len(shard_results), infos, shard_results[-1][0] if shard_results else None)
+
+    return [results[path_id] for path_id in path_ids if path_id in results]
+
+
+def export_parallel(assets_path, path_ids, workers, mapped=False, groups=None):
+    """
+    以行程池平行解碼紋理，依完成順序逐一產生 PNG 資料
+
+    同時只保留有限數量的區段在處理中，消費端（例如寫入網路回應）較慢時
+    已完成的結果不會在記憶體中無限累積。提前停止迭代時會取消尚未開始的區段。
+
+    Args:
+        assets_path (str): 資源檔案路徑
+        path_ids (list): 要匯出的 path_id
+        workers (int): 工作行程數量
+        mapped (bool): 工作行程是否以記憶體映射載入資源檔案
+        groups (list): 必須由同一個工作行程處理的 path_id 群組（見 sprite_groups）
+
+    Yields:
+        tuple: (path_id, 檔名, PNG 資料)
+    """
+    shard_count = max(workers * 4, -(-len(path_ids) // EXPORT_SHARD_SIZE))
+    shards = iter(shard_path_ids(path_ids, shard_count, groups))
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(assets_path, mapped)) as executor:
+        pending = set()
+
+        def submit_next():
+            shard = next(shards, None)
+            if shard:
+                pending.add(executor.submit(_export_shard, shard))
+
+        for _ in range(workers * 2):
+            submit_next()
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    submit_next()
+                    for path_id, filename, data, error in future.result():
+                        if error:
+                            print(error)
+                        if data is not None:
+                            yield path_id, filename, data
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="從 Unity .assets 檔案提取 Texture2D 與 Sprite 圖片")
+    parser.add_argument("assets_path", help="輸入的 .assets 檔案路徑（同資料夾的 .resS 會自動載入）")
+    parser.add_argument("-o", "--output-dir", required=True, help="輸出資料夾")
+    parser.add_argument("--type", action="append", choices=TEXTURE_TYPES, help="只提取指定類型（可重複指定）")
+    parser.add_argument("--name", help="名稱條件，含 * ? [ 時以 glob 比對，否則為部分比對（不分大小寫）")
+    parser.add_argument("--path-id", help="只提取指定的 path_id（逗號分隔）")
+    parser.add_argument("--min-width", type=int, default=0, help="最小寬度")
+    parser.add_argument("--min-height", type=int, default=0, help="最小高度")
+    parser.add_argument("--format", help="只提取指定的紋理格式（逗號分隔，例如 DXT5,BC7）")
+    parser.add_argument("--output-format", choices=list(OUTPUT_FORMATS), default='png',
+                        help="輸出格式：png（預設）、webp 或 raw（未壓縮的 RGBA 像素）")
+    parser.add_argument("--png-compress-level", type=int, choices=range(10), metavar="0-9",
+                        help="PNG 壓縮等級，數字越小越快、檔案越大")
+    parser.add_argument("--webp-quality", type=int, choices=range(101), metavar="0-100",
+                        help="WebP 品質（預設為無失真）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="工作行程數量（預設為 CPU 核心數）")
+    parser.add_argument("--index", help="索引檔路徑（預設為輸出資料夾中的 index.json）")
+    parser.add_argument("--no-mmap", action="store_true", help="不以記憶體映射載入資源檔案")
+
+    args = parser.parse_args()
+    mapped = not args.no_mmap and os.name != 'nt'
+    output_options = {'output_format': args.output_format, 'compress_level': args.png_compress_level,
+                      'quality': args.webp_quality}
+
+    def split(value):
+        return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+    try:
+        path_ids = [int(path_id) for path_id in split(args.path_id) or []]
+    except ValueError:
+        parser.error("--path-id 必須為以逗號分隔的數字")
+
+    try:
+        start = time.perf_counter()
+        env = open_environment(args.assets_path, mapped)
+        objects, infos = select_objects(env.objects, args.name, path_ids, args.type, split(args.format),
+                                        args.min_width, args.min_height)
+        print(f"符合條件的紋理: {len(objects)} 個")
+        os.makedirs(args.output_dir, exist_ok=True)
+
+        errors = []
+        if args.workers > 1 and len(objects) > 1:
+            done = 0
+
+            def progress(count, new_infos, path_id):
+                nonlocal done
+                done += count
+                print(f"已處理 {done}/{len(objects)}")
+
+            extracted = extract_parallel(args.assets_path, [obj.path_id for obj in objects], args.output_dir,
+                                         args.workers, mapped, progress, sprite_groups(objects), output_options)
+        else:
+            extracted = []
+            for obj, info, error in extract_objects(objects, args.output_dir, output_options=output_options):
+                if error:
+                    print(error)
+                    errors.append({'path_id': obj.path_id, 'error': error})
+                if info:
+                    extracted.append(info)
+
+        # 平行處理時錯誤只會列印，索引中統一記錄為未輸出的紋理
+        reported = {entry['path_id'] for entry in errors} | {info['path_id'] for info in extracted}
+        errors.extend({'path_id': info['path_id'], 'error': "無法解碼或提取失敗"}
+                      for info in infos if info['path_id'] not in reported)
+
+        index_path = args.index or os.path.join(args.output_dir, 'index.json')
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'source': os.path.abspath(args.assets_path),
+                'output_format': args.output_format,
+                'count': len(extracted),
+                'textures': extracted,
+                'errors': errors
+            }, f, ensure_ascii=False, indent=2)
+
+        elapsed = time.perf_counter() - start
+        print(f"完成: 輸出 {len(extracted)} / {len(objects)} 個紋理，耗時 {elapsed:.2f} 秒，索引: {index_path}")
+        return 1 if errors else 0
+    except Exception as e:
+        print(f"錯誤: {str(e)}")
+        return 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,141 +1,832 @@
-import UnityPy
 from PIL import Image
 import os
 import argparse
+import csv
+import json
+import re
+import shutil
+import stat
+import sys
+import tempfile
+import time
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from texture_cache import TextureCache, hash_bytes
+from texture_encoder import (MIP_FILTERS, TextureEncoder, describe_encode, encode_levels, encode_request,
+                             pixels_image)
+from texture_extractor import format_name, open_environment, peek_object_name, run_tasks, texture_data
 
-def replace_texture(assets_path, path_id, new_texture_path, output_path):
+# 以記憶體映射載入資源檔案（Windows 上映射中的檔案無法被取代，不使用）
+MMAP_LOADING = os.name != 'nt'
+
+# 儲存後的驗證程度：off 不驗證；header 重新解析替換的物件，比對尺寸、格式與資料雜湊；
+# full 另外解碼第 0 層並比對像素；reload 另外讀取檔案中的所有物件
+VERIFY_LEVELS = ('off', 'header', 'full', 'reload')
+VERIFY_LEVEL = 'header'
+
+# 解碼結果與輸入的 RGBA 圖片逐位元組相同的格式（full 驗證時比對像素雜湊）
+LOSSLESS_FORMATS = ('RGBA32',)
+
+# Linux 的 FICLONE ioctl 編號（_IOW(0x94, 9, int)），用來建立 reflink 副本
+FICLONE = 0x40049409
+
+# --encode-cache 磁碟快取的大小上限
+ENCODE_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+def index_objects(env):
+    """建立 path_id 到物件讀取器的索引，避免每次查詢都走訪所有物件"""
+    return {obj.path_id: obj for obj in env.objects}
+
+def load_replacement_image(image_path, size=None):
     """
-    取代 .assets 檔案中指定 Path_ID 的 Texture2D 資源
-    
+    載入替換用的圖片並轉為 RGBA，必要時調整為目標尺寸
+
+    盡量減少整張圖片的複製：JPEG 以 draft 在解碼時就縮小，大幅縮小時先以
+    reduce 整數倍縮小再重新取樣，RGB/灰階圖片先縮小再轉換，已是目標尺寸的
+    RGBA 圖片則直接使用。
+    只處理圖片本身，不需存取 Unity 環境，可在執行緒池中平行執行。
+
+    Args:
+        image_path (str): 圖片路徑
+        size (tuple): 目標尺寸 (寬, 高)，None 表示不調整
+
+    Returns:
+        PIL.Image.Image: RGBA 圖片
+    """
+    new_image = Image.open(image_path)
+    print(f"新圖片大小: {new_image.size}")
+    size = tuple(size) if size else new_image.size
+
+    if new_image.size != size and new_image.format == 'JPEG':
+        # 以 DCT 縮放解碼，結果仍不小於目標尺寸
+        new_image.draft('RGB', size)
+
+    if new_image.mode not in ('RGBA', 'RGB', 'L', 'LA'):
+        # 調色盤等模式需先轉換才能正確縮放
+        new_image = new_image.convert('RGBA')
+    if new_image.size != size:
+        print(f"調整圖片大小從 {new_image.size} 到 {size}")
+        new_image = new_image.resize(size, reducing_gap=3.0)
+    if new_image.mode != 'RGBA':
+        new_image = new_image.convert('RGBA')
+    new_image.load()
+    return new_image
+
+def load_manifest(manifest_path):
+    """
+    讀取批次替換清單
+
+    支援 JSON（物件陣列，或 {path_id 或名稱: 圖片} 的對照表；目錄模式可用
+    {檔案名稱: {path_id 或名稱: 圖片}} 依檔案分組）與 CSV（需有 image 欄位，
+    以及 path_id 或 name 欄位，目錄模式另需 file 欄位）。相對的圖片路徑以清單所在資料夾為準。
+
+    Args:
+        manifest_path (str): 清單檔案路徑
+
+    Returns:
+        list: 每項為 {'file': str 或 None, 'path_id': int 或 None, 'name': str 或 None, 'image': str}
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    if manifest_path.lower().endswith('.csv'):
+        with open(manifest_path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            # 對照表的鍵為整數（可為負數）時視為 path_id，否則視為紋理名稱
+            def mapping_rows(mapping, file=None):
+                return [
+                    {'file': file, 'path_id' if re.fullmatch(r'-?\d+', str(key)) else 'name': key, 'image': image}
+                    for key, image in mapping.items()
+                ]
+            if all(isinstance(value, dict) for value in rows.values()):
+                rows = [row for file, mapping in rows.items() for row in mapping_rows(mapping, file)]
+            else:
+                rows = mapping_rows(rows)
+
+    entries = []
+    for index, row in enumerate(rows, 1):
+        file = str(row.get('file') or '').strip()
+        path_id = str(row.get('path_id') or '').strip()
+        name = str(row.get('name') or '').strip()
+        image = str(row.get('image') or '').strip()
+        if not image or not (path_id or name):
+            raise ValueError(f"清單第 {index} 項缺少 image 或 path_id/name 欄位")
+        entries.append({
+            'file': file or None,
+            'path_id': int(path_id) if path_id else None,
+            'name': name or None,
+            'image': image if os.path.isabs(image) else os.path.join(base_dir, image)
+        })
+    return entries
+
+def discover_assets(input_dir):
+    """
+    找出資料夾中的 .assets 檔案（含對應的 .resS）
+
+    Returns:
+        dict: 檔案名稱 -> .assets 路徑
+    """
+    found = {}
+    for filename in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, filename)
+        if filename.endswith('.assets') and os.path.isfile(path):
+            found[filename] = path
+    return found
+
+def apply_replacement(texture, new_image):
+    """
+    以新圖片更新已讀取的 Texture2D 物件，保留原始格式與設定
+
+    Args:
+        texture: obj.read() 取得的 Texture2D
+        new_image (PIL.Image.Image): 已調整尺寸的 RGBA 圖片
+
+    Returns:
+        str: 改用 RGBA32 格式時的說明，否則為 None
+    """
+    # 儲存原始設定
+    original_settings = {
+        "m_TextureFormat": texture.m_TextureFormat,
+        "m_CompleteImageSize": texture.m_CompleteImageSize,
+        "m_TextureDimension": texture.m_TextureDimension,
+        "m_TextureSettings": texture.m_TextureSettings,
+        "m_StreamData": texture.m_StreamData,
+        "m_MipMap": texture.m_MipMap,
+        "m_IsReadable": texture.m_IsReadable,
+    }
+
+    print("更新紋理圖片...")
+    # 設定新的圖片
+    texture.image = new_image
+
+    # 還原原始設定
+    for key, value in original_settings.items():
+        if hasattr(texture, key):
+            setattr(texture, key, value)
+
+    print("儲存物件變更...")
+    try:
+        # 將修改後的數據寫回
+        texture.save()
+    except Exception as e:
+        print(f"使用原始格式儲存失敗，嘗試使用 RGBA32 格式: {str(e)}")
+        # 如果儲存失敗，嘗試使用預設格式
+        texture.m_TextureFormat = 4  # RGBA32 format
+        texture.save()
+        return "無法以原始格式儲存，已改用 RGBA32（檔案會變大）"
+    return None
+
+def apply_encoded(texture, data):
+    """
+    以已編碼的像素資料更新 Texture2D，保留原始格式與 mipmap 層數
+
+    資料改為內嵌於 .assets，原本的串流位置會被清除。
+    """
+    texture.image_data = data
+    texture.m_CompleteImageSize = len(data)
+    stream = getattr(texture, 'm_StreamData', None)
+    if stream is not None:
+        stream.path = ''
+        stream.offset = 0
+        stream.size = 0
+    texture.save()
+
+def encode_texture_data(obj, texture, new_image):
+    """
+    依紋理原始格式將圖片編碼為像素資料（含完整的 mipmap 層級）
+
+    Returns:
+        bytes: 編碼後的資料，無法維持原始格式時回傳 None
+    """
+    return encode_levels(*encode_request(obj, texture, new_image))
+
+def stage_in_place_patch(obj, texture, new_image, assets_name, serialized_file=None, new_data=None):
+    """
+    在新資料與原本大小相同時，準備直接覆寫檔案的修補內容
+
+    串流紋理的資料位於 .resS 的 m_StreamData.offset；內嵌紋理則以物件在
+    .assets 中的起點加上像素資料在物件內的位置計算（僅限未壓縮的 SerializedFile）。
+    內嵌紋理會同步更新記憶體中的物件，之後若仍需完整序列化也能保持一致。
+
+    Args:
+        obj: 目標物件讀取器
+        texture: obj.read() 取得的 Texture2D
+        new_image (PIL.Image.Image): 已調整尺寸的 RGBA 圖片
+        assets_name (str): 目標 .assets 的檔案名稱（用來確認 .resS 對應）
+        serialized_file: 直接從檔案載入的 SerializedFile（內嵌紋理需要）
+        new_data (bytes): 已編碼的資料（可省略，省略時在此編碼）
+
+    Returns:
+        tuple: ('resS' 或 'assets', 位移, 新資料)，無法原地修補時回傳 None
+    """
+    if new_data is None:
+        new_data = encode_texture_data(obj, texture, new_image)
+    if new_data is None:
+        return None
+
+    stream = getattr(texture, 'm_StreamData', None)
+    if stream is not None and stream.path:
+        if os.path.basename(stream.path) != assets_name + '.resS' or stream.size != len(new_data):
+            return None
+        return 'resS', stream.offset, new_data
+
+    old_data = bytes(texture.image_data or b'')
+    if not old_data or len(old_data) != len(new_data):
+        return None
+    if serialized_file is None or obj.assets_file is not serialized_file:
+        return None
+
+    # 像素資料在物件中必須唯一，才能確定其位置
+    raw = bytes(obj.get_raw_data())
+    index = raw.find(old_data)
+    if index < 0 or raw.rfind(old_data) != index:
+        return None
+
+    texture.image_data = new_data
+    texture.save()
+    return 'assets', obj.byte_start + index, new_data
+
+def default_file_mode():
+    """新建檔案的預設權限（0666 扣除目前的 umask）"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+def save_environment(env, output_path):
+    """
+    序列化環境並寫入輸出檔案
+
+    序列化結果一次寫入同一資料夾的暫存檔，fsync 後再以原子性的更名取代輸出檔案，
+    寫入過程中斷也不會留下不完整的檔案。序列化結果寫完即釋放，不與後續的重新載入
+    同時佔用記憶體。暫存檔只有擁有者可讀寫，取代前改為原檔案的權限
+    （新檔案則為 umask 決定的預設權限）。
+
+    Returns:
+        int: 寫入的位元組數
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(output_path).st_mode)
+    except FileNotFoundError:
+        mode = default_file_mode()
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(output_path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            data = env.file.save()
+            size = len(data)
+            f.write(data)
+            del data
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return size
+
+def peak_memory_mb():
+    """回傳目前行程的記憶體使用峰值（MB），平台不支援時回傳 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以位元組為單位，Linux 以 KB 為單位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def format_peak_memory():
+    """記憶體峰值的顯示文字"""
+    peak = peak_memory_mb()
+    return f"{peak:.1f} MB" if peak is not None else "無法取得"
+
+def clone_file(source, destination, hardlink=True):
+    """
+    建立檔案的副本，盡量不實際複製資料
+
+    依序嘗試 reflink（FICLONE，Btrfs/XFS 等支援寫入時複製的檔案系統）與硬連結，
+    都不可行時才完整複製。硬連結與來源共用同一份內容，原地修改前需先以
+    make_private 分離（write_patch 會自動處理；save_environment 以更名取代檔案，
+    本來就不會改到來源）。
+
+    Args:
+        source (str): 來源檔案
+        destination (str): 目標檔案（已存在時先刪除，不會截斷與其他檔案共用的內容）
+        hardlink (bool): 是否允許使用硬連結
+
+    Returns:
+        str: 使用的方式（'reflink'、'hardlink' 或 'copy'）
+    """
+    if os.path.abspath(source) == os.path.abspath(destination):
+        raise ValueError(f"來源與目標為同一檔案: {source}")
+    if os.path.lexists(destination):
+        os.remove(destination)
+
+    if fcntl is not None:
+        try:
+            with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(source, destination)
+            return 'reflink'
+        except OSError:
+            if os.path.exists(destination):
+                os.remove(destination)
+
+    if hardlink:
+        try:
+            os.link(source, destination)
+            return 'hardlink'
+        except OSError:
+            pass
+
+    shutil.copy2(source, destination)
+    return 'copy'
+
+def make_private(path):
+    """
+    檔案以硬連結與其他檔案共用內容時，先複製成獨立的檔案
+
+    Returns:
+        bool: 是否實際複製
+    """
+    if os.stat(path).st_nlink <= 1:
+        return False
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        shutil.copy2(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    print(f"首次修改，已將共用的檔案複製為獨立檔案: {path}")
+    return True
+
+def write_patch(path, offset, data):
+    """只覆寫檔案中指定位置的位元組，並讀回確認（與其他檔案共用內容時先分離）"""
+    make_private(path)
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        f.seek(offset)
+        if f.read(len(data)) != data:
+            raise IOError(f"覆寫 {path} 於位移 {offset} 後讀回內容不符")
+
+def expected_texture(texture, data=None):
+    """
+    記錄替換後紋理應有的狀態，作為儲存後驗證的依據
+
+    Args:
+        texture: 已套用替換的 Texture2D
+        data (bytes): 寫入的像素資料，省略時取記憶體中紋理目前的資料
+
+    Returns:
+        dict: {'width', 'height', 'format', 'checksum'}
+    """
+    if data is None:
+        data = texture_data(texture)
+    return {'width': texture.m_Width, 'height': texture.m_Height,
+            'format': int(texture.m_TextureFormat), 'checksum': hash_bytes(bytes(data))}
+
+def verify_texture(obj, expected=None, level='header', image=None):
+    """
+    從儲存後的檔案重新解析單一物件並與預期比對
+
+    Args:
+        obj: 儲存後檔案中的物件讀取器
+        expected (dict): expected_texture 的結果，None 時只確認物件可讀取
+        level (str): 'header' 或 'full'
+        image (PIL.Image.Image): 輸入的 RGBA 圖片，full 驗證無損格式時比對像素
+
+    Returns:
+        str: 驗證結果說明
+
+    Raises:
+        ValueError: 與預期不符
+    """
+    texture = obj.read()
+    details = []
+    if expected is not None:
+        actual = (texture.m_Width, texture.m_Height, int(texture.m_TextureFormat))
+        wanted = (expected['width'], expected['height'], expected['format'])
+        if actual != wanted:
+            raise ValueError(f"尺寸或格式不符：預期 {wanted}，實際為 {actual}")
+        if hash_bytes(bytes(texture_data(texture))) != expected['checksum']:
+            raise ValueError("紋理資料的雜湊與寫入的內容不符")
+        details.append("資料雜湊相符")
+    if level != 'full':
+        return '，'.join(details) or "物件可讀取"
+
+    decoded = texture.image
+    if expected is not None and decoded.size != (expected['width'], expected['height']):
+        raise ValueError(f"解碼後的圖片大小 {decoded.size} 不符")
+    details.append(f"解碼大小 {decoded.size}")
+    if image is not None and format_name(texture.m_TextureFormat) in LOSSLESS_FORMATS:
+        if hash_bytes(decoded.convert('RGBA').tobytes()) != hash_bytes(image.tobytes()):
+            raise ValueError("解碼後的像素與輸入圖片不符")
+        details.append("像素與輸入圖片相同")
+    return '，'.join(details)
+
+def verify_saved_file(path, checks, level=VERIFY_LEVEL, objects=None):
+    """
+    驗證儲存後的檔案，只重新解析替換過的物件
+
+    Args:
+        path (str): 儲存後的 .assets 檔案
+        checks (dict): path_id -> (expected_texture 的結果或 None, 輸入圖片或 None)
+        level (str): VERIFY_LEVELS 之一
+        objects (dict): 已開啟的 path_id -> 物件讀取器（省略時開啟 path）
+
+    Returns:
+        dict: path_id -> 錯誤訊息，驗證成功為 None
+    """
+    if level not in VERIFY_LEVELS:
+        raise ValueError(f"不支援的驗證程度: {level}")
+    if level == 'off' or not checks:
+        return {path_id: None for path_id in checks}
+
+    if objects is None:
+        objects = index_objects(open_environment(path, MMAP_LOADING))
+    if level == 'reload':
+        # 完整模式：確認檔案中的每個物件都仍可讀取
+        print(f"讀取全部 {len(objects)} 個物件進行驗證...")
+        for obj in objects.values():
+            try:
+                obj.read()
+            except Exception as e:
+                error = f"驗證失敗：物件 (path_id: {obj.path_id}) 無法讀取: {e}"
+                return {path_id: error for path_id in checks}
+
+    errors = {}
+    for path_id, (expected, image) in checks.items():
+        obj = objects.get(path_id)
+        if obj is None:
+            errors[path_id] = "驗證失敗：找不到更新後的紋理"
+            continue
+        try:
+            note = verify_texture(obj, expected, 'header' if level == 'header' else 'full', image)
+            print(f"驗證成功 (path_id: {path_id})：{note}")
+            errors[path_id] = None
+        except Exception as e:
+            errors[path_id] = f"驗證失敗：{e}"
+    return errors
+
+def resolve_entries(env, entries):
+    """
+    將清單項目對應到 Texture2D 物件
+
+    Returns:
+        tuple: (path_id 索引, 每項對應的 path_id 或錯誤訊息清單)
+    """
+    objects_by_id = index_objects(env)
+
+    # 只有清單使用名稱時才建立名稱索引
+    ids_by_name = {}
+    if any(entry['path_id'] is None for entry in entries):
+        for obj in objects_by_id.values():
+            if obj.type.name == "Texture2D":
+                ids_by_name.setdefault(peek_object_name(obj), []).append(obj.path_id)
+
+    resolved = []
+    for entry in entries:
+        if entry['path_id'] is not None:
+            obj = objects_by_id.get(entry['path_id'])
+            if obj is None or obj.type.name != "Texture2D":
+                resolved.append((None, f"找不到 Path_ID 為 {entry['path_id']} 的 Texture2D"))
+            else:
+                resolved.append((entry['path_id'], None))
+            continue
+
+        matches = ids_by_name.get(entry['name'], [])
+        if not matches:
+            resolved.append((None, f"找不到名稱為 {entry['name']} 的 Texture2D"))
+        elif len(matches) > 1:
+            resolved.append((None, f"名稱 {entry['name']} 對應到多個 Texture2D: {matches}"))
+        else:
+            resolved.append((matches[0], None))
+    return objects_by_id, resolved
+
+def replace_textures(assets_path, entries, output_path, encoder=None, verify=VERIFY_LEVEL):
+    """
+    批次取代 .assets 檔案中的多個 Texture2D：載入一次、全部套用後儲存並驗證一次
+
+    所有圖片先載入，再交給編碼階段一次平行編碼為原始格式，最後依序套用。
+
     Args:
         assets_path (str): 輸入的 .assets 檔案路徑
-        path_id (int): 要取代的 Texture2D 的 Path_ID
-        new_texture_path (str): 新紋理圖片的路徑
+        entries (list): load_manifest 格式的替換項目
         output_path (str): 輸出的 .assets 檔案路徑
+        encoder (TextureEncoder): 編碼器（可省略，預設只在記憶體中記憶結果）
+        verify (str): 儲存後的驗證程度（見 VERIFY_LEVELS）
+
+    Returns:
+        list: 每項結果 {'entry', 'path_id', 'success', 'message', 'encode_seconds'}
     """
-    print(f"已載入新圖片: {new_texture_path}")
-    print("重新載入資源檔案...")
-    
+    if encoder is None:
+        encoder = TextureEncoder()
+
+    print("載入資源檔案...")
+
     # 讀取 .assets 檔案
     try:
-        env = UnityPy.load(assets_path)
+        env = open_environment(assets_path, MMAP_LOADING)
     except Exception as e:
         raise Exception(f"載入資源檔案時發生錯誤: {str(e)}")
-    
-    # 讀取新的紋理圖片
-    try:
-        new_image = Image.open(new_texture_path)
-        print(f"新圖片大小: {new_image.size}")
-        new_image = new_image.convert('RGBA')
-    except Exception as e:
-        raise Exception(f"讀取新圖片時發生錯誤: {str(e)}")
-    
-    # 尋找並取代指定的 Texture2D
-    texture_found = False
-    for obj in env.objects:
-        if obj.path_id == path_id and obj.type.name == "Texture2D":
-            print(f"開始處理 Texture2D (path_id: {path_id})")
-            texture_found = True
-            
-            try:
-                # 獲取 Texture2D 物件
-                texture = obj.read()
-                
-                # 確保圖片尺寸相符
-                if hasattr(texture, 'image'):
-                    original_size = texture.image.size
-                    print(f"原始圖片大小: {original_size}")
-                    if original_size != new_image.size:
-                        print(f"調整新圖片大小為: {original_size}")
-                        new_image = new_image.resize(original_size)
-                
-                # 儲存原始設定
-                original_settings = {
-                    "m_TextureFormat": texture.m_TextureFormat,
-                    "m_CompleteImageSize": texture.m_CompleteImageSize,
-                    "m_TextureDimension": texture.m_TextureDimension,
-                    "m_TextureSettings": texture.m_TextureSettings,
-                    "m_StreamData": texture.m_StreamData,
-                    "m_MipMap": texture.m_MipMap,
-                    "m_IsReadable": texture.m_IsReadable,
-                }
-                
-                print("更新紋理圖片...")
-                # 設定新的圖片
-                texture.image = new_image
-                
-                # 還原原始設定
-                for key, value in original_settings.items():
-                    if hasattr(texture, key):
-                        setattr(texture, key, value)
-                
-                print("儲存物件變更...")
-                try:
-                    # 將修改後的數據寫回
-                    texture.save()
-                except Exception as e:
-                    print(f"使用原始格式儲存失敗，嘗試使用 RGBA32 格式: {str(e)}")
-                    # 如果儲存失敗，嘗試使用預設格式
-                    texture.m_TextureFormat = 4  # RGBA32 format
-                    texture.save()
-                
-            except Exception as e:
-                raise Exception(f"處理紋理時發生錯誤: {str(e)}")
-            
-            break
-    
-    if not texture_found:
-        raise ValueError(f"找不到 Path_ID 為 {path_id} 的 Texture2D")
-    
+
+    objects_by_id, resolved = resolve_entries(env, entries)
+
+    report = []
+    staged = []  # 與 report 對應的 (Texture2D, 新圖片)，失敗的項目為 None
+    for entry, (path_id, error) in zip(entries, resolved):
+        result = {'entry': entry, 'path_id': path_id, 'success': False, 'message': error or '',
+                  'encode_seconds': None}
+        report.append(result)
+        staged.append(None)
+        if error:
+            print(f"錯誤: {error}")
+            continue
+
+        try:
+            # 獲取 Texture2D 物件
+            texture = objects_by_id[path_id].read()
+
+            # 讀取新的紋理圖片並確保尺寸相符
+            print(f"載入新圖片: {entry['image']}")
+            new_image = load_replacement_image(entry['image'], (texture.m_Width, texture.m_Height))
+            staged[-1] = (texture, new_image)
+        except Exception as e:
+            result['message'] = f"處理紋理時發生錯誤: {str(e)}"
+            print(f"錯誤: {result['message']}")
+
+    # 編碼階段：一次處理所有圖片，未命中快取的項目平行編碼
+    requests = []
+    for index, (result, item) in enumerate(zip(report, staged)):
+        request = encode_request(objects_by_id[result['path_id']], *item) if item else None
+        if request:
+            # 之後只保留像素陣列，原始圖片改以不複製的包裝取代
+            staged[index] = (item[0], pixels_image(request[0]))
+        requests.append(request)
+    encoded = encoder.encode_many(requests)
+
+    patches = []  # 大小不變、可直接覆寫的 (檔案種類, 位移, 資料)
+    checks = {}  # path_id -> (預期狀態, 輸入圖片)，儲存後驗證用
+    needs_save = False
+    for result, item, encode_result in zip(report, staged, encoded):
+        if item is None:
+            continue
+        path_id = result['path_id']
+        texture, new_image = item
+        data, seconds, _ = encode_result
+        result['encode_seconds'] = seconds
+        notes = [describe_encode(encode_result)]
+        print(f"開始處理 Texture2D (path_id: {path_id})：{notes[0]}")
+        try:
+            patch = None
+            if data is not None:
+                patch = stage_in_place_patch(objects_by_id[path_id], texture, new_image,
+                                             os.path.basename(assets_path), env.file, new_data=data)
+            if patch:
+                print(f"編碼後大小不變，將直接覆寫 {patch[0]} 於位移 {patch[1]}")
+                patches.append(patch)
+            elif data is not None:
+                apply_encoded(texture, data)
+                needs_save = True
+            else:
+                notes.append(apply_replacement(texture, new_image))
+                needs_save = True
+            if verify != 'off':
+                checks[path_id] = (expected_texture(texture, data), new_image)
+            result['success'] = True
+            result['message'] = '，'.join(note for note in notes if note)
+        except Exception as e:
+            result['message'] = f"處理紋理時發生錯誤: {str(e)}"
+            print(f"錯誤: {result['message']}")
+
+    if not any(result['success'] for result in report):
+        return report
+
+    ress_file = assets_path + ".resS"
+    output_ress = output_path + ".resS"
+    same_file = os.path.abspath(assets_path) == os.path.abspath(output_path)
+
     # 儲存修改後的 .assets 檔案
     try:
-        print("儲存已編輯的檔案，準備中...")
-        if os.path.exists(output_path):
-            print(f"刪除已存在的檔案: {output_path}")
-            os.remove(output_path)
-        
-        print(f"儲存已編輯的檔案: {output_path}")
-        with open(output_path, "wb") as f:
-            data = env.file.save()
-            f.write(data)
-            print(f"檔案儲存成功，大小: {len(data)} bytes")
-        
-        # 如果有對應的 .resS 檔案，也要一併複製
-        ress_file = assets_path + ".resS"
-        if os.path.exists(ress_file):
-            output_ress = output_path + ".resS"
-            print(f"複製 .resS 檔案到: {output_ress}")
-            import shutil
-            shutil.copy2(ress_file, output_ress)
-        
-        # 重新載入並驗證
-        print("重新載入環境進行驗證...")
-        verify_env = UnityPy.load(output_path)
-        for obj in verify_env.objects:
-            if obj.path_id == path_id and obj.type.name == "Texture2D":
-                verify_texture = obj.read()
-                if hasattr(verify_texture, 'image'):
-                    print(f"驗證成功：新圖片大小為 {verify_texture.image.size}")
-                break
-                
+        if needs_save:
+            print(f"儲存已編輯的檔案: {output_path}")
+            size = save_environment(env, output_path)
+            print(f"檔案儲存成功，大小: {size} bytes，記憶體峰值: {format_peak_memory()}")
+            # 內嵌紋理的修補已同步到記憶體中的物件，隨序列化一併寫入
+            patches = [patch for patch in patches if patch[0] == 'resS']
+        elif not same_file:
+            # 所有替換大小都不變，不需重新序列化
+            method = clone_file(assets_path, output_path)
+            print(f"所有替換大小不變，已建立原始檔案的副本（{method}）: {output_path}")
+
+        # 如果有對應的 .resS 檔案，也要一併建立副本（只有原地修補時才會實際複製）
+        if os.path.exists(ress_file) and not same_file:
+            method = clone_file(ress_file, output_ress)
+            print(f"已建立 .resS 檔案的副本（{method}）: {output_ress}")
+
+        for kind, offset, data in patches:
+            write_patch(output_ress if kind == 'resS' else output_path, offset, data)
+        if patches:
+            print(f"已直接覆寫 {len(patches)} 個紋理的像素資料")
+
+        # 先釋放編輯用的環境，再只重新解析替換過的物件進行驗證
+        env = objects_by_id = staged = None
+        errors = verify_saved_file(output_path, checks, verify)
+        for result in report:
+            error = errors.get(result['path_id']) if result['success'] else None
+            if error:
+                result['success'] = False
+                result['message'] = error
+
     except Exception as e:
         raise Exception(f"儲存檔案時發生錯誤: {str(e)}")
 
+    return report
+
+def replace_texture(assets_path, path_id, new_texture_path, output_path, encoder=None, verify=VERIFY_LEVEL):
+    """
+    取代 .assets 檔案中指定 Path_ID 的 Texture2D 資源
+
+    Args:
+        assets_path (str): 輸入的 .assets 檔案路徑
+        path_id (int): 要取代的 Texture2D 的 Path_ID
+        new_texture_path (str): 新紋理圖片的路徑
+        output_path (str): 輸出的 .assets 檔案路徑
+        encoder (TextureEncoder): 編碼器（可省略）
+        verify (str): 儲存後的驗證程度（見 VERIFY_LEVELS）
+    """
+    entry = {'file': None, 'path_id': path_id, 'name': None, 'image': new_texture_path}
+    result = replace_textures(assets_path, [entry], output_path, encoder, verify)[0]
+    if not result['success']:
+        if result['path_id'] is None:
+            raise ValueError(result['message'])
+        raise Exception(result['message'])
+
+def print_report(report):
+    """列印批次替換結果，回傳失敗項目數"""
+    failed = [result for result in report if not result['success']]
+    print(f"完成: 成功 {len(report) - len(failed)} / {len(report)}")
+    for result in failed:
+        entry = result['entry']
+        target = entry['path_id'] if entry['path_id'] is not None else entry['name']
+        if entry.get('file'):
+            target = f"{entry['file']}:{target}"
+        print(f"  失敗 {target} ({entry['image']}): {result['message']}")
+    encode_times = [result['encode_seconds'] for result in report if result.get('encode_seconds') is not None]
+    if encode_times:
+        print(f"編碼 {len(encode_times)} 個紋理，合計 {sum(encode_times):.2f} 秒，最長 {max(encode_times):.2f} 秒")
+    return len(failed)
+
+def asset_size(assets_path):
+    """計算 .assets 與 .resS 的總大小（位元組）"""
+    total = os.path.getsize(assets_path)
+    if os.path.exists(assets_path + ".resS"):
+        total += os.path.getsize(assets_path + ".resS")
+    return total
+
+def create_encoder(cache_dir=None, workers=None, mip_options=None):
+    """
+    建立編碼器，指定 cache_dir 時編碼結果也保存在磁碟上供下次執行沿用
+
+    mip_options 為 TextureEncoder 的 mip_filter、gamma_correct、premultiplied 參數
+    """
+    cache = TextureCache(cache_dir, ENCODE_CACHE_MAX_BYTES) if cache_dir else None
+    return TextureEncoder(cache, workers, **(mip_options or {}))
+
+def _process_file(assets_path, entries, output_path, encode_cache=None, mip_options=None, verify=VERIFY_LEVEL):
+    """在工作行程中處理單一檔案，錯誤只影響該檔案"""
+    try:
+        # 已經以檔案為單位平行處理，編碼不再另開行程池
+        encoder = create_encoder(encode_cache, 1, mip_options)
+        return replace_textures(assets_path, entries, output_path, encoder, verify), None
+    except Exception as e:
+        return None, str(e)
+
+def replace_directory(input_dir, entries, output_dir, workers=None, encode_cache=None, mip_options=None,
+                      verify=VERIFY_LEVEL):
+    """
+    以行程池平行處理資料夾中的所有 .assets 檔案
+
+    清單項目依 file 欄位分派到對應的檔案，只處理有替換項目的檔案。
+    單一檔案失敗（包括使工作行程崩潰）不會中斷其他檔案。
+
+    Args:
+        input_dir (str): 遊戲資料夾（含 .assets/.resS）
+        entries (list): load_manifest 格式的替換項目
+        output_dir (str): 輸出資料夾
+        workers (int): 工作行程數量，None 表示 CPU 核心數
+        encode_cache (str): 編碼結果的磁碟快取資料夾（可省略）
+        mip_options (dict): mipmap 產生方式（見 create_encoder）
+        verify (str): 儲存後的驗證程度（見 VERIFY_LEVELS）
+
+    Returns:
+        list: 所有項目的結果（與 replace_textures 相同格式）
+    """
+    assets_files = discover_assets(input_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    report = []
+    grouped = {}
+    for entry in entries:
+        if not entry['file']:
+            report.append({'entry': entry, 'path_id': None, 'success': False, 'message': "未指定所屬的 .assets 檔案"})
+        elif entry['file'] not in assets_files:
+            report.append({'entry': entry, 'path_id': None, 'success': False, 'message': f"找不到檔案 {entry['file']}"})
+        else:
+            grouped.setdefault(entry['file'], []).append(entry)
+
+    print(f"找到 {len(assets_files)} 個 .assets 檔案，其中 {len(grouped)} 個需要處理")
+
+    start = time.perf_counter()
+    total_bytes = 0
+    done_files = 0
+    # 工作行程崩潰時重建行程池重新執行其他檔案，只有造成崩潰的檔案記為失敗（見 run_tasks）
+    tasks = [(filename, _process_file, (assets_files[filename], file_entries, os.path.join(output_dir, filename),
+                                        encode_cache, mip_options, verify))
+             for filename, file_entries in grouped.items()]
+    outcomes = {}
+    for filename, result, exception in run_tasks(tasks, workers or os.cpu_count() or 1):
+        outcomes[filename] = result if exception is None else (None, f"工作行程異常結束: {exception}")
+
+    for filename in grouped:
+        file_report, error = outcomes[filename]
+        if error:
+            print(f"錯誤: 處理 {filename} 時發生錯誤: {error}")
+            report.extend({'entry': entry, 'path_id': None, 'success': False, 'message': error}
+                          for entry in grouped[filename])
+            continue
+
+        report.extend(file_report)
+        done_files += 1
+        total_bytes += asset_size(assets_files[filename])
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"處理 {done_files} 個檔案，耗時 {elapsed:.2f} 秒"
+          f"（{done_files / elapsed:.2f} 檔案/秒，{total_bytes / elapsed / (1024 * 1024):.2f} MB/秒）")
+    return report
+
 def main():
     parser = argparse.ArgumentParser(description="取代 Unity .assets 檔案中的 Texture2D 資源")
-    parser.add_argument("assets_path", help="輸入的 .assets 檔案路徑")
-    parser.add_argument("path_id", type=int, help="要取代的 Texture2D 的 Path_ID")
-    parser.add_argument("new_texture_path", help="新紋理圖片的路徑")
-    parser.add_argument("output_path", help="輸出的 .assets 檔案路徑")
-    
+    parser.add_argument("assets_path", nargs="?", help="輸入的 .assets 檔案路徑")
+    parser.add_argument("path_id", type=int, nargs="?", help="要取代的 Texture2D 的 Path_ID")
+    parser.add_argument("new_texture_path", nargs="?", help="新紋理圖片的路徑")
+    parser.add_argument("output_path", nargs="?", help="輸出的 .assets 檔案路徑")
+    parser.add_argument("--manifest", help="批次替換清單（JSON 或 CSV，欄位為 path_id 或 name 與 image）")
+    parser.add_argument("-o", "--output", help="批次模式的輸出 .assets 檔案路徑")
+    parser.add_argument("--input-dir", help="目錄模式：包含所有 .assets/.resS 的遊戲資料夾")
+    parser.add_argument("--output-dir", help="目錄模式：輸出資料夾")
+    parser.add_argument("--workers", type=int, help="工作行程數量（目錄模式為檔案數，其他模式為編碼；預設為 CPU 核心數）")
+    parser.add_argument("--encode-cache", help="編碼結果的磁碟快取資料夾，重複套用相同圖片時不必重新編碼")
+    parser.add_argument("--mip-filter", choices=MIP_FILTERS, default='box', help="產生 mipmap 的濾波器（預設 box）")
+    parser.add_argument("--mip-gamma", action="store_true", help="在線性色彩空間中產生 mipmap（RGB 視為 sRGB）")
+    parser.add_argument("--mip-premultiplied", action="store_true", help="以預乘 alpha 產生 mipmap，避免透明邊緣出現雜色")
+    parser.add_argument("--verify", choices=VERIFY_LEVELS, default=VERIFY_LEVEL,
+                        help="儲存後的驗證程度：off 不驗證、header 比對替換物件的尺寸格式與資料雜湊（預設）、"
+                             "full 另外解碼比對像素、reload 另外讀取檔案中的所有物件")
+
     args = parser.parse_args()
-    
+    mip_options = {'mip_filter': args.mip_filter, 'gamma_correct': args.mip_gamma,
+                   'premultiplied': args.mip_premultiplied}
+
     try:
-        replace_texture(args.assets_path, args.path_id, args.new_texture_path, args.output_path)
+        if args.input_dir:
+            if not args.manifest or not args.output_dir or args.assets_path:
+                parser.error("目錄模式需指定 --manifest 與 --output-dir，且不可同時指定 assets_path")
+            report = replace_directory(args.input_dir, load_manifest(args.manifest), args.output_dir,
+                                       args.workers, args.encode_cache, mip_options, args.verify)
+            return 1 if print_report(report) else 0
+
+        if not args.assets_path:
+            parser.error("請指定 assets_path，或以 --input-dir 使用目錄模式")
+
+        if args.manifest:
+            if args.path_id is not None or not args.output:
+                parser.error("使用 --manifest 時請以 --output 指定輸出檔案，且不可同時指定 path_id")
+            encoder = create_encoder(args.encode_cache, args.workers, mip_options)
+            report = replace_textures(args.assets_path, load_manifest(args.manifest), args.output, encoder,
+                                      args.verify)
+            return 1 if print_report(report) else 0
+
+        if args.path_id is None or not args.new_texture_path or not args.output_path:
+            parser.error("請指定 path_id、new_texture_path 與 output_path，或使用 --manifest")
+        replace_texture(args.assets_path, args.path_id, args.new_texture_path, args.output_path,
+                        create_encoder(args.encode_cache, args.workers, mip_options), args.verify)
     except Exception as e:
         print(f"錯誤: {str(e)}")
         return 1
-    
+
     return 0
 
 if __name__ == "__main__":